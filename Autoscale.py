@@ -0,0 +1,163 @@
+import os
+import socket
+import subprocess
+import time
+import logging
+from threading  import Thread, Lock, Event
+from State      import State
+from Runtime    import Runtime
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+PROBE_TIMEOUT = 2
+# The probe thread exits after this many idle intervals, the next request starts it again
+PROBE_IDLE_INTERVALS = 4
+
+
+def read_proc_cpu_ticks(pid: int):
+    """utime + stime of a process in clock ticks, None if it is gone"""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as file:
+            stat = file.read()
+    except OSError:
+        return None
+    # comm (field 2) may contain spaces, fields after it are space separated
+    fields = stat[stat.rfind(")") + 2:].split()
+    return int(fields[11]) + int(fields[12])
+
+
+class AutoscalePolicy:
+    """
+        Decide how many instances a MultiTask should run from a sampled load signal.
+        Probes (commands, TCP healthchecks) can block: they run in a per-policy thread,
+        desired() runs in the supervision tick and only reads the last sampled value.
+    """
+
+    def __init__(self, name: str, config: dict, min_procs: int, max_procs: int):
+        self.name = name
+        self.metric = config["metric"]
+        self.source = config["source"]
+        self.target = config["target"]
+        self.scale_up = config["scale_up"]
+        self.scale_down = config["scale_down"]
+        self.step = config["step"]
+        self.interval = config["interval"]
+        self.cooldown_up = config["cooldown_up"]
+        self.cooldown_down = config["cooldown_down"]
+        self.min_procs = min_procs
+        self.max_procs = max_procs
+        self.last_sample_time = 0
+        self.last_scale_time = 0
+        self.last_value = None
+        self.cpu_ticks = {}
+        self.cpu_time = None
+        self.lock = Lock()
+        self.requested = Event()
+        self.request = ([], 0)
+        self.thread = None
+
+    def _sample_cpu(self, pids: list, now: float):
+        ticks = {}
+        used = 0.0
+        for pid in pids:
+            value = read_proc_cpu_ticks(pid)
+            if value is None:
+                continue
+            ticks[pid] = value
+            if pid in self.cpu_ticks:
+                used += value - self.cpu_ticks[pid]
+        elapsed = now - self.cpu_time if self.cpu_time is not None else 0
+        first_sample = not self.cpu_ticks
+        self.cpu_ticks = ticks
+        self.cpu_time = now
+        if first_sample or elapsed <= 0 or not ticks:
+            return None
+        # Mean CPU percentage per running instance
+        return used / CLK_TCK / elapsed * 100 / len(ticks)
+
+    def _sample_queue(self, running: int):
+        if self.source == "queue_file":
+            with open(self.target, "r") as file:
+                depth = float(file.read().strip() or 0)
+        else:
+            result = subprocess.run(self.target, capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+            depth = float(result.stdout.strip() or 0)
+        # Backlog per instance, so thresholds do not depend on the group size
+        return depth / max(running, 1)
+
+    def _sample_latency(self):
+        start = time.monotonic()
+        if self.source == "healthcheck":
+            with socket.create_connection(self.target, timeout=PROBE_TIMEOUT):
+                pass
+        else:
+            subprocess.run(self.target, capture_output=True, timeout=PROBE_TIMEOUT, check=True)
+        return (time.monotonic() - start) * 1000
+
+    def sample(self, pids: list, now: float):
+        """Blocking probe, called from the probe thread"""
+        try:
+            if self.metric == "cpu":
+                return self._sample_cpu(pids, now)
+            elif self.metric == "queue":
+                return self._sample_queue(len(pids))
+            else:
+                return self._sample_latency()
+        except (OSError, ValueError, subprocess.SubprocessError) as e:
+            logging.info(f"{self.name} autoscale probe failed : {e}")
+            # An unreachable healthcheck is the worst possible latency
+            return float("inf") if self.metric == "latency" else None
+
+    def _probe(self):
+        while True:
+            if not self.requested.wait(self.interval * PROBE_IDLE_INTERVALS):
+                with self.lock:
+                    if not self.requested.is_set():
+                        self.thread = None
+                        return
+            with self.lock:
+                self.requested.clear()
+                pids, now = self.request
+            value = self.sample(pids, now)
+            with self.lock:
+                self.last_value = value
+
+    def _request_sample(self, pids: list, now: float):
+        with self.lock:
+            self.request = (pids, now)
+            self.requested.set()
+            if self.thread is None:
+                self.thread = Thread(target=self._probe, daemon=True)
+                self.thread.start()
+
+    def due(self, now: float) -> bool:
+        return now - self.last_sample_time >= self.interval
+
+    def desired(self, tasks: list, now: float = None) -> int:
+        """
+            Return the wanted number of instances, or the current one when nothing must change.
+            Never blocks: it uses the value sampled since the last call and asks for the next one.
+        """
+        now = Runtime().clock.time() if now is None else now
+        current = len(tasks)
+        if not self.due(now):
+            return current
+
+        running = [task for task in tasks if task.processus_status == State.RUNNING and task.process is not None]
+        with self.lock:
+            # Each sample is used for one decision only
+            value, self.last_value = self.last_value, None
+        self.last_sample_time = now
+        self._request_sample([task.process.pid for task in running], now)
+        if value is None:
+            return current
+
+        wanted = current
+        # Values between scale_down and scale_up are the hysteresis band: no change
+        if value > self.scale_up and now - self.last_scale_time >= self.cooldown_up:
+            wanted = min(current + self.step, self.max_procs)
+        elif value < self.scale_down and now - self.last_scale_time >= self.cooldown_down:
+            wanted = max(current - self.step, self.min_procs)
+        if wanted != current:
+            self.last_scale_time = now
+            logging.info(f"{self.name} autoscale {self.metric}={value:.2f} : {current} -> {wanted}")
+        return wanted
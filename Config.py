@@ -0,0 +1,224 @@
+import os
+import glob
+import yaml
+import pickle
+import hashlib
+import logging
+from validate   import validate_program, revalidate_paths, reset_path_checks
+
+# The C loader is several times faster, PyYAML ships without it on some systems
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# Bump when validate_program output changes, old cache files are then ignored
+CACHE_VERSION = 9
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "taskmaster")
+
+
+def load_yaml(data):
+    return yaml.load(data, Loader=SafeLoader)
+
+
+class ConfigCache:
+    """
+        Compiled config: validated programs of a config file, stored with pickle.
+        An entry is valid while the file keeps the same mtime and size, or the same
+        content hash, and taskmaster runs from the same directory (default workingdir).
+    """
+
+    def __init__(self, directory: str = CACHE_DIR):
+        self.directory = directory
+
+    def _entry_path(self, path_to_config: str) -> str:
+        key = hashlib.sha256(os.path.abspath(path_to_config).encode()).hexdigest()
+        return os.path.join(self.directory, f"{key}.pickle")
+
+    def load(self, path_to_config: str, stat: os.stat_result, read_content):
+        """
+            Return the cached {"programs", "includes"} of the file or None.
+            read_content is only called when mtime or size changed, to compare hashes.
+        """
+        entry_path = self._entry_path(path_to_config)
+        try:
+            # Never unpickle a file another user could have written
+            if os.stat(entry_path).st_uid != os.getuid():
+                return None
+            with open(entry_path, "rb") as file:
+                entry = pickle.load(file)
+        except (OSError, pickle.PickleError, EOFError, AttributeError, ImportError):
+            return None
+
+        if entry.get("version") != CACHE_VERSION or entry.get("cwd") != os.getcwd():
+            return None
+        if entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return entry["data"]
+        if entry["sha256"] == hashlib.sha256(read_content()).hexdigest():
+            # Touched but not modified: refresh the stat part of the key
+            self.store(path_to_config, stat, entry["sha256"], entry["data"])
+            return entry["data"]
+        return None
+
+    def store(self, path_to_config: str, stat: os.stat_result, sha256: str, data: dict):
+        entry = {
+            "version": CACHE_VERSION,
+            "cwd": os.getcwd(),
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": sha256,
+            "data": data,
+        }
+        entry_path = self._entry_path(path_to_config)
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            with open(tmp_path, "wb") as file:
+                pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, entry_path)
+        except OSError as e:
+            # The cache is an optimization, never a reason to fail
+            logging.info(f"config cache : can't write '{entry_path}' : {e}")
+
+
+class ConfigError(Exception):
+    pass
+
+
+class ConfigFile:
+    """One file of the config: its programs and what identifies its content"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime_ns = None
+        self.size = None
+        self.sha256 = None
+        self.includes: list = []
+        # name -> (raw_config, validated program)
+        self.programs: dict = {}
+
+
+class ConfigSet:
+    """
+        Main config file and the files matched by its 'include:' globs.
+        refresh() only parses and validates the files whose content changed.
+    """
+
+    def __init__(self, path_to_config: str, cache: ConfigCache = None):
+        self.path = os.path.abspath(path_to_config)
+        self.cache = cache
+        self.files: dict = {}
+
+    def _parse(self, config_file: ConfigFile, content: bytes, is_main: bool):
+        try:
+            config_data = load_yaml(content)
+        except yaml.YAMLError as e:
+            raise ConfigError(f"while parsing YAML in '{config_file.path}': {e}")
+
+        if not isinstance(config_data, dict) or not ("programs" in config_data or (is_main and "include" in config_data)):
+            raise ConfigError(f"configuration file '{config_file.path}' must have a section 'programs:'")
+        if not is_main and "include" in config_data:
+            raise ConfigError(f"'{config_file.path}': 'include' is only allowed in the main config file")
+
+        includes = config_data.get("include", [])
+        if isinstance(includes, str):
+            includes = [includes]
+        if not isinstance(includes, list) or not all(isinstance(pattern, str) for pattern in includes):
+            raise ConfigError(f"'{config_file.path}': 'include' must be a glob or a list of globs")
+        config_file.includes = includes
+
+        raw_programs = config_data.get("programs") or {}
+        if not isinstance(raw_programs, dict):
+            raise ConfigError(f"'{config_file.path}': 'programs' must be a dictionary")
+        config_file.programs = {}
+        for name, config in raw_programs.items():
+            if ":" in str(name):
+                raise ConfigError(f"invalid program name '{name}'. ':' is not allowed in program names.")
+            try:
+                config_file.programs[name] = (config, validate_program(name, config))
+            except Exception as e:
+                raise ConfigError(f"in task '{name}': {e}")
+
+    def _read(self, path: str, is_main: bool) -> bool:
+        """(Re)load a file if its content changed, return True when it did"""
+        previous = self.files.get(path)
+        try:
+            with open(path, "rb") as file:
+                stat = os.fstat(file.fileno())
+                if previous is not None and (previous.mtime_ns, previous.size) == (stat.st_mtime_ns, stat.st_size):
+                    return False
+                content = file.read()
+        except FileNotFoundError:
+            raise ConfigError(f"file '{path}' not found.")
+        except OSError as e:
+            raise ConfigError(f"can't read '{path}': {e}")
+
+        sha256 = hashlib.sha256(content).hexdigest()
+        if previous is not None and previous.sha256 == sha256:
+            previous.mtime_ns, previous.size = stat.st_mtime_ns, stat.st_size
+            return False
+
+        config_file = ConfigFile(path)
+        config_file.mtime_ns, config_file.size, config_file.sha256 = stat.st_mtime_ns, stat.st_size, sha256
+        cached = self.cache.load(path, stat, lambda: content) if self.cache is not None else None
+        if cached is not None:
+            config_file.includes = cached["includes"]
+            config_file.programs = cached["programs"]
+            for name, (config, program) in config_file.programs.items():
+                try:
+                    # The cache can't know if a directory or a file was removed since
+                    revalidate_paths(name, program)
+                except Exception as e:
+                    raise ConfigError(f"in task '{name}': {e}")
+        else:
+            self._parse(config_file, content, is_main)
+            if self.cache is not None:
+                self.cache.store(path, stat, sha256, {"includes": config_file.includes, "programs": config_file.programs})
+        self.files[path] = config_file
+        return True
+
+    def _included_paths(self) -> list:
+        base = os.path.dirname(self.path)
+        paths = []
+        for pattern in self.files[self.path].includes:
+            for path in sorted(glob.glob(os.path.join(base, os.path.expanduser(pattern)))):
+                if os.path.isfile(path) and path not in paths:
+                    paths.append(path)
+        return paths
+
+    def include_patterns(self) -> list:
+        base = os.path.dirname(self.path)
+        return [os.path.join(base, os.path.expanduser(pattern)) for pattern in self.files[self.path].includes]
+
+    def refresh(self) -> list:
+        """Reload changed files, return the paths that changed (added and removed included)"""
+        reset_path_checks()
+        # Files are replaced only when everything parsed, a broken edit keeps the previous config
+        previous_files = dict(self.files)
+        try:
+            changed = [self.path] if self._read(self.path, True) else []
+            included = self._included_paths()
+            for path in included:
+                if self._read(path, False):
+                    changed.append(path)
+            for path in list(self.files):
+                if path != self.path and path not in included:
+                    del self.files[path]
+                    changed.append(path)
+            self.programs()
+        except ConfigError:
+            self.files = previous_files
+            raise
+        return changed
+
+    def programs(self) -> dict:
+        """name -> (raw_config, validated program) over every file"""
+        programs = {}
+        origin = {}
+        for path, config_file in self.files.items():
+            for name, value in config_file.programs.items():
+                if name in programs:
+                    raise ConfigError(f"program '{name}' is defined in '{origin[name]}' and '{path}'")
+                programs[name] = value
+                origin[name] = path
+        return programs
@@ -0,0 +1,168 @@
+import os
+import hmac
+import json
+import socket
+import logging
+import ipaddress
+from threading  import Thread, Event
+from State      import State, STOPPED_STATES
+from Runtime    import Runtime
+from Quiet      import Quiet
+
+COMMAND_TIMEOUT = 60
+POLL_RATE = 0.1
+
+
+def parse_address(address: str):
+    """unix:/path, tcp:host:port or host:port -> (family, address)"""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    if address.startswith("tcp:"):
+        address = address[len("tcp:"):]
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"invalid address '{address}', use unix:/path or tcp:host:port")
+    return socket.AF_INET, (host, int(port))
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class ControlServer:
+    """
+        JSON lines request / response on a local or TCP socket, one request per line:
+            {"cmd": "status", "since": seq, "generation": n}
+            {"cmd": "start" | "stop" | "restart", "names": [...] | "all"}
+            {"cmd": "update"}
+        With a token, every request must carry {"token": "..."}.
+        Responses carry the messages the command would have printed in "messages".
+        A TCP socket without token may only listen on loopback.
+    """
+
+    def __init__(self, supervisor, address: str, token: str = None):
+        self.supervisor = supervisor
+        self.token = token
+        self.stop_event = Event()
+        family, self.address = parse_address(address)
+        if family == socket.AF_INET and not token and not is_loopback(self.address[0]):
+            raise ValueError(f"'{address}' is reachable from the network, a token is required (--token)")
+        if family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+        self.server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(self.address)
+        if family == socket.AF_UNIX:
+            os.chmod(self.address, 0o600)
+        self.server.listen(128)
+        self.server.settimeout(1)
+        self.thread = Thread(target=self._accept, daemon=True)
+
+    def _accept(self):
+        while not self.stop_event.is_set():
+            try:
+                client, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client: socket.socket):
+        try:
+            with client, client.makefile("rwb") as stream:
+                for line in stream:
+                    try:
+                        response = self.handle(json.loads(line))
+                    except (ValueError, KeyError, TypeError) as e:
+                        response = {"ok": False, "error": str(e)}
+                    stream.write(json.dumps(response).encode() + b"\n")
+                    stream.flush()
+        except OSError as e:
+            logging.info(f"control : client closed : {e}")
+
+    def _wait(self, processes: list, done) -> dict:
+        deadline = Runtime().clock.time() + COMMAND_TIMEOUT
+        pending = list(processes)
+        while pending and Runtime().clock.time() < deadline:
+            with self.supervisor.lock:
+                pending = [processus for processus in pending if not done(processus)]
+            if pending:
+                Runtime().clock.sleep(POLL_RATE)
+        return {"success": [p.name for p in processes if p not in pending], "pending": [p.name for p in pending]}
+
+    def _targets(self, names) -> tuple:
+        if names == "all":
+            return None, True, []
+        if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            raise TypeError("'names' must be \"all\" or a list of names")
+        unknown = [name for name in names if self.supervisor._get_task_by_full_name(name) is None]
+        return [name for name in names if name not in unknown], None, unknown
+
+    def handle(self, request: dict) -> dict:
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "request must be a JSON object"}
+        if self.token is not None and not hmac.compare_digest(str(request.get("token", "")), self.token):
+            return {"ok": False, "error": "bad token"}
+
+        # What the tasks and the supervisor would print goes back to the client, not to the local shell
+        messages = []
+        quiet = Quiet()
+        quiet.enable(messages)
+        try:
+            response = self._command(request, messages.append)
+        finally:
+            quiet.disable()
+        if messages:
+            response["messages"] = messages
+        return response
+
+    def _command(self, request: dict, report) -> dict:
+        command = request["cmd"]
+        if command == "status":
+            return {"ok": True, **self.supervisor.snapshot(request.get("since"), request.get("generation"))}
+
+        if command in ("start", "stop", "restart"):
+            names, all, unknown = self._targets(request["names"])
+            result = {"ok": True, "errors": unknown}
+            if command in ("stop", "restart"):
+                stopping = self.supervisor.stop(names, all, wait=False, report=report)
+                self.supervisor._wait_stopped(stopping)
+                result["stopped"] = [processus.name for processus in stopping]
+            if command in ("start", "restart"):
+                starting = self.supervisor.start(names, all, wait=False, report=report)
+                waited = self._wait(starting, lambda p: p.processus_status in (State.RUNNING, State.BACKOFF)
+                                    or p.processus_status in STOPPED_STATES)
+                with self.supervisor.lock:
+                    result["started"] = [name for name in waited["success"]
+                                         if self.supervisor._get_task_by_full_name(name).processus_status not in STOPPED_STATES]
+                result["errors"] += [name for name in waited["success"] if name not in result["started"]]
+                result["pending"] = waited["pending"]
+            return result
+
+        if command == "update":
+            # Same lock as the shell and the queued reread, see Supervisor.reread()
+            self.supervisor.reread(report)
+            self.supervisor.update(report)
+            return {"ok": True}
+
+        return {"ok": False, "error": f"unknown command '{command}'"}
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.server.close()
+        self.thread.join()
+        if isinstance(self.address, str):
+            try:
+                os.unlink(self.address)
+            except OSError:
+                pass
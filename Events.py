@@ -0,0 +1,198 @@
+import os
+import json
+import queue
+import socket
+import fnmatch
+import logging
+from collections    import deque
+from threading      import Lock, Thread, Event
+from Runtime        import Runtime
+
+HISTORY_SIZE = 10000
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class Subscriber:
+    def __init__(self, programs: list = None, states: list = None):
+        # Patterns on the group name or on the full name (web, web:3, web:*)
+        self.programs = programs or None
+        self.states = {state.upper() for state in states} if states else None
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = False
+
+    def matches(self, event: dict) -> bool:
+        if self.states is not None and event["to"] not in self.states:
+            return False
+        if self.programs is not None:
+            return any(fnmatch.fnmatchcase(event["name"], pattern) or fnmatch.fnmatchcase(event["group"], pattern)
+                       for pattern in self.programs)
+        return True
+
+
+class EventBus:
+    """
+        State transitions of every process, numbered by seq.
+        The last HISTORY_SIZE events are kept so a subscriber can resume from a seq.
+        A subscriber whose queue is full is dropped: it never slows the supervision down.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.lock = Lock()
+            cls._instance.seq = 0
+            cls._instance.history = deque(maxlen=HISTORY_SIZE)
+            cls._instance.subscribers = []
+        return cls._instance
+
+    def _deliver(self, subscriber: Subscriber, event: dict) -> bool:
+        try:
+            subscriber.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            subscriber.dropped = True
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+            logging.info(f"events : slow subscriber dropped at seq {event['seq']}")
+            return False
+
+    def publish(self, name: str, from_state, to_state, exitcode: int = None):
+        with self.lock:
+            self.seq += 1
+            event = {
+                "seq": self.seq,
+                "time": Runtime().clock.time(),
+                "name": name,
+                "group": name.split(":", 1)[0],
+                "from": from_state.name,
+                "to": to_state.name,
+                "exitcode": exitcode,
+            }
+            self.history.append(event)
+            for subscriber in list(self.subscribers):
+                if subscriber.matches(event):
+                    self._deliver(subscriber, event)
+            return self.seq
+
+    def subscribe(self, subscriber: Subscriber, since: int = None) -> dict:
+        """Register and queue the kept events after since, returns the bus position"""
+        with self.lock:
+            oldest = self.history[0]["seq"] if self.history else self.seq + 1
+            if since is not None:
+                for event in self.history:
+                    if event["seq"] > since and subscriber.matches(event):
+                        if not self._deliver(subscriber, event):
+                            break
+            if not subscriber.dropped:
+                self.subscribers.append(subscriber)
+            # Events between since and oldest are lost for this subscriber
+            return {"seq": self.seq, "oldest": oldest, "gap": since is not None and since + 1 < oldest}
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+
+def check_request(request) -> str:
+    """Error message for a malformed subscribe request, None when it is valid"""
+    if not isinstance(request, dict):
+        return "subscribe request must be a JSON object"
+    for key in ("programs", "states"):
+        value = request.get(key)
+        if value is not None and (not isinstance(value, list) or not all(isinstance(item, str) for item in value)):
+            return f"'{key}' must be a list of strings"
+    since = request.get("since")
+    if since is not None and (not isinstance(since, int) or isinstance(since, bool)):
+        return "'since' must be an integer"
+    return None
+
+
+class EventServer:
+    """
+        Local socket streaming the bus as JSON lines.
+        The client sends one line {"programs": [...], "states": [...], "since": seq}
+        (every key optional), then receives a header line and one line per event.
+    """
+
+    def __init__(self, path: str, bus: EventBus = None):
+        self.path = path
+        self.bus = bus or EventBus()
+        self.stop_event = Event()
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        os.chmod(path, 0o600)
+        self.server.listen()
+        self.server.settimeout(1)
+        self.thread = Thread(target=self._accept, daemon=True)
+
+    def _accept(self):
+        while not self.stop_event.is_set():
+            try:
+                client, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client: socket.socket):
+        subscriber = None
+        try:
+            with client, client.makefile("rwb") as stream:
+                line = stream.readline()
+                request = json.loads(line) if line.strip() else {}
+                error = check_request(request)
+                if error is not None:
+                    stream.write(json.dumps({"subscribed": False, "error": error}).encode() + b"\n")
+                    stream.flush()
+                    return
+                subscriber = Subscriber(request.get("programs"), request.get("states"))
+                header = self.bus.subscribe(subscriber, request.get("since"))
+                stream.write(json.dumps({"subscribed": True, **header}).encode() + b"\n")
+                stream.flush()
+                while not self.stop_event.is_set():
+                    try:
+                        event = subscriber.queue.get(timeout=1)
+                    except queue.Empty:
+                        if subscriber.dropped:
+                            break
+                        continue
+                    stream.write(json.dumps(event).encode() + b"\n")
+                    if subscriber.queue.empty():
+                        stream.flush()
+                if subscriber.dropped:
+                    stream.write(json.dumps({"dropped": True}).encode() + b"\n")
+                    stream.flush()
+        except (OSError, ValueError) as e:
+            logging.info(f"events : client closed : {e}")
+        finally:
+            if subscriber is not None:
+                self.bus.unsubscribe(subscriber)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.server.close()
+        self.thread.join()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def subscribe(path: str, programs: list = None, states: list = None, since: int = None):
+    """Client side: yield the header then the events of an EventServer"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        with client.makefile("rwb") as stream:
+            request = {"programs": programs, "states": states, "since": since}
+            stream.write(json.dumps(request).encode() + b"\n")
+            stream.flush()
+            for line in stream:
+                yield json.loads(line)
@@ -0,0 +1,130 @@
+import json
+import socket
+import time
+from datetime           import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from threading          import Lock
+from Control            import parse_address
+from Config             import load_yaml
+
+MAX_CONCURRENCY = 64
+REQUEST_TIMEOUT = 90
+
+
+class Host:
+    """A remote taskmaster and its last known status"""
+
+    def __init__(self, name: str, address: str):
+        self.name = name
+        self.address = address
+        self.family, self.sockaddr = parse_address(address)
+        self.lock = Lock()
+        self.seq = None
+        self.generation = None
+        self.processes = {}
+        self.error = None
+
+    def request(self, payload: dict, timeout: float = REQUEST_TIMEOUT) -> dict:
+        with socket.socket(self.family, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(self.sockaddr)
+            with client.makefile("rwb") as stream:
+                stream.write(json.dumps(payload).encode() + b"\n")
+                stream.flush()
+                line = stream.readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        return json.loads(line)
+
+    def merge_status(self, response: dict):
+        """Apply a full or incremental snapshot to the cached one"""
+        with self.lock:
+            if response["full"]:
+                self.processes = {}
+            for processus in response["processes"]:
+                self.processes[processus["name"]] = processus
+            self.seq = response["seq"]
+            self.generation = response["generation"]
+            if len(self.processes) != response["count"]:
+                # Instances appeared or disappeared (autoscale): next status is a full one
+                self.seq = None
+
+
+class Federation:
+    """
+        One control plane over many taskmaster instances (ControlServer sockets).
+        Requests are sent to every host in parallel, at most `concurrency` at a time.
+    """
+
+    def __init__(self, hosts: dict, token: str = None, concurrency: int = MAX_CONCURRENCY):
+        self.hosts = {name: Host(name, address) for name, address in hosts.items()}
+        self.token = token
+        self.executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(self.hosts) or 1)))
+
+    @classmethod
+    def from_file(cls, path: str, token: str = None, concurrency: int = MAX_CONCURRENCY):
+        with open(path, "rb") as file:
+            data = load_yaml(file.read())
+        if not isinstance(data, dict) or not isinstance(data.get("hosts"), dict):
+            raise ValueError(f"'{path}' must have a section 'hosts:' of name: address")
+        return cls({str(name): str(address) for name, address in data["hosts"].items()}, token, concurrency)
+
+    def _call(self, host: Host, payload: dict) -> dict:
+        if self.token is not None:
+            payload = {**payload, "token": self.token}
+        try:
+            response = host.request(payload)
+            host.error = None if response.get("ok") else response.get("error")
+        except (OSError, ValueError) as e:
+            host.error = str(e)
+            response = {"ok": False, "error": str(e)}
+        return response
+
+    def fan_out(self, payload_for, hosts: list = None) -> dict:
+        """payload_for(host) -> payload, returns {host name: response}"""
+        targets = [self.hosts[name] for name in hosts] if hosts is not None else list(self.hosts.values())
+        futures = {host.name: self.executor.submit(self._call, host, payload_for(host)) for host in targets}
+        return {name: future.result() for name, future in futures.items()}
+
+    def status(self, hosts: list = None) -> dict:
+        """Refresh the cached snapshots (incrementally when possible), return {host: processes}"""
+        def payload_for(host: Host):
+            if host.seq is None:
+                return {"cmd": "status"}
+            return {"cmd": "status", "since": host.seq, "generation": host.generation}
+
+        responses = self.fan_out(payload_for, hosts)
+        merged = {}
+        for name, response in responses.items():
+            host = self.hosts[name]
+            if response.get("ok"):
+                host.merge_status(response)
+            merged[name] = sorted(host.processes.values(), key=lambda processus: processus["name"])
+        return merged
+
+    def command(self, command: str, params: list) -> dict:
+        """params are names for every host, name@host or all@host for a single one"""
+        targets = {}
+        for param in params:
+            name, _, host = param.partition("@")
+            for host_name in ([host] if host else self.hosts):
+                if host_name not in self.hosts:
+                    raise ValueError(f"unknown host '{host_name}'")
+                if name == "all" or targets.get(host_name) == "all":
+                    targets[host_name] = "all"
+                else:
+                    targets.setdefault(host_name, []).append(name)
+        return self.fan_out(lambda host: {"cmd": command, "names": targets[host.name]}, list(targets))
+
+    def update(self, hosts: list = None) -> dict:
+        return self.fan_out(lambda host: {"cmd": "update"}, hosts)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def format_status(host: str, processus: dict) -> str:
+    buffer = f"{host:<16}{processus['name']:<32}{processus['state']:<10}"
+    if processus["state"] == "RUNNING" and processus["start"] is not None:
+        buffer += f"pid {processus['pid']}, uptime {timedelta(seconds=int(time.time() - processus['start']))}"
+    return buffer
@@ -0,0 +1,87 @@
+from array      import array
+from datetime   import timedelta
+from State      import State
+
+HISTORY_SIZE = 32
+NO_EXITCODE = -2 ** 31
+# A process leaving one of these for BACKOFF died on its own
+FAILURE_SOURCES = (State.STARTING, State.RUNNING)
+
+
+class TransitionHistory:
+    """
+        Last HISTORY_SIZE transitions of one process, in a ring of flat arrays:
+        time (d), from and to states (B), exit code (i, negative is the signal),
+        14 bytes per transition, allocated on the first one.
+    """
+    __slots__ = ("size", "count", "times", "states", "exitcodes")
+
+    def __init__(self, size: int = HISTORY_SIZE):
+        self.size = size
+        self.count = 0
+        self.times = None
+        self.states = None
+        self.exitcodes = None
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def record(self, time: float, from_state: State, to_state: State, exitcode: int = None):
+        if self.times is None:
+            self.times = array("d", bytes(8 * self.size))
+            self.states = array("B", bytes(2 * self.size))
+            self.exitcodes = array("i", bytes(4 * self.size))
+        slot = self.count % self.size
+        self.times[slot] = time
+        self.states[2 * slot] = from_state.value
+        self.states[2 * slot + 1] = to_state.value
+        self.exitcodes[slot] = NO_EXITCODE if exitcode is None else exitcode
+        self.count += 1
+
+    def transitions(self):
+        """Oldest first: (time, from, to, exitcode)"""
+        for index in range(self.count - len(self), self.count):
+            slot = index % self.size
+            exitcode = self.exitcodes[slot]
+            yield (self.times[slot], State(self.states[2 * slot]), State(self.states[2 * slot + 1]),
+                   None if exitcode == NO_EXITCODE else exitcode)
+
+    def stats(self, now: float) -> dict:
+        """Counts and time per state over the kept window, see summarize()"""
+        result = {"transitions": self.count, "restarts": 0, "failures": 0, "window": 0.0, "time_in_state": {}}
+        transitions = list(self.transitions())
+        if not transitions:
+            return result
+        result["window"] = now - transitions[0][0]
+        for index, (time, from_state, to_state, _) in enumerate(transitions):
+            if to_state == State.STARTING and from_state == State.BACKOFF:
+                result["restarts"] += 1
+            if to_state == State.FATAL or (to_state == State.BACKOFF and from_state in FAILURE_SOURCES):
+                result["failures"] += 1
+            end = transitions[index + 1][0] if index + 1 < len(transitions) else now
+            result["time_in_state"][to_state.name] = result["time_in_state"].get(to_state.name, 0.0) + end - time
+        return result
+
+
+def summarize(stats: list) -> dict:
+    """Merge the stats of several processes (a program or a group), add restart rate and MTBF"""
+    result = {"transitions": 0, "restarts": 0, "failures": 0, "window": 0.0, "time_in_state": {}}
+    for item in stats:
+        for key in ("transitions", "restarts", "failures"):
+            result[key] += item[key]
+        result["window"] = max(result["window"], item["window"])
+        for state, seconds in item["time_in_state"].items():
+            result["time_in_state"][state] = result["time_in_state"].get(state, 0.0) + seconds
+    uptime = result["time_in_state"].get("RUNNING", 0.0) + result["time_in_state"].get("STARTING", 0.0)
+    # Restarts per hour of the whole program, MTBF in process uptime between two failures
+    result["restart_rate"] = result["restarts"] * 3600 / result["window"] if result["window"] > 0 else 0.0
+    result["mtbf"] = uptime / result["failures"] if result["failures"] else None
+    return result
+
+
+def format_stats(name: str, stats: dict) -> str:
+    mtbf = str(timedelta(seconds=int(stats["mtbf"]))) if stats["mtbf"] is not None else "-"
+    states = " ".join(f"{state} {timedelta(seconds=int(seconds))}"
+                      for state, seconds in sorted(stats["time_in_state"].items(), key=lambda item: -item[1]))
+    return (f"{name:<32}restarts {stats['restarts']:<6}failures {stats['failures']:<6}"
+            f"{stats['restart_rate']:>8.1f}/h  mtbf {mtbf:<10}{states}")
@@ -0,0 +1,82 @@
+import time
+from threading  import Thread, Event, Lock
+
+PROGRESS_INTERVAL = 2
+
+
+class Job:
+    """A shell command running in its own thread, cancel only stops it from waiting"""
+
+    def __init__(self, job_id: int, description: str, target, notify):
+        self.id = job_id
+        self.description = description
+        self.notify = notify
+        self.cancel = Event()
+        self.finished = Event()
+        self.done = 0
+        self.total = 0
+        self.phase = "running"
+        self.errors = []
+        self.last_progress = time.monotonic()
+        self.thread = Thread(target=self._run, args=(target,), daemon=True)
+
+    def report(self, message: str):
+        if "ERROR" in message:
+            self.errors.append(message)
+
+    def progress(self, phase: str):
+        def callback(done: int, total: int):
+            self.phase, self.done, self.total = phase, done, total
+            now = time.monotonic()
+            if done < total and now - self.last_progress >= PROGRESS_INTERVAL:
+                self.last_progress = now
+                self.notify(f"[{self.id}] {done}/{total} {phase}")
+        return callback
+
+    def _run(self, target):
+        try:
+            target(self)
+            state = "cancelled" if self.cancel.is_set() else "done"
+        except Exception as e:
+            self.errors.append(f"Error: {e}")
+            state = "failed"
+        summary = f" ({self.done}/{self.total} {self.phase})" if self.total else ""
+        self.phase = state
+        lines = [f"[{self.id}] {state}: {self.description}{summary}"] + self.errors
+        self.finished.set()
+        self.notify("\n".join(lines))
+
+    def status(self) -> str:
+        if self.finished.is_set():
+            return f"[{self.id}] {self.phase:<10}{self.description}"
+        return f"[{self.id}] {'running':<10}{self.description} ({self.done}/{self.total} {self.phase})"
+
+
+class JobManager:
+    def __init__(self, notify=print):
+        self.notify = notify
+        self.jobs = {}
+        self.next_id = 1
+        self.lock = Lock()
+
+    def submit(self, description: str, target) -> Job:
+        """target(job) runs in the background, it should use job.report/progress/cancel"""
+        with self.lock:
+            job = Job(self.next_id, description, target, self.notify)
+            self.jobs[job.id] = job
+            self.next_id += 1
+        job.thread.start()
+        return job
+
+    def running(self) -> list:
+        return [job for job in self.jobs.values() if not job.finished.is_set()]
+
+    def forget_finished(self):
+        with self.lock:
+            self.jobs = {job_id: job for job_id, job in self.jobs.items() if not job.finished.is_set()}
+
+    def get(self, job_id: str) -> Job:
+        try:
+            return self.jobs.get(int(job_id.lstrip("%")))
+        except ValueError:
+            return None
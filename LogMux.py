@@ -0,0 +1,212 @@
+import os
+import time
+import socket
+import logging
+import selectors
+from threading  import Thread, Lock
+from Runtime    import Runtime
+from validate   import is_syslog_target
+
+READ_SIZE = 65536
+# A line longer than this is written in pieces
+MAX_LINE = 65536
+SYSLOG_SOCKET = "/dev/log"
+SYSLOG_INFO = 14    # user.info
+SYSLOG_ERR = 11     # user.err
+
+
+class FileSink:
+    """One O_APPEND fd per file for every instance, one write per batch"""
+
+    def __init__(self, path: str):
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.last_second = None
+        self.last_stamp = b""
+
+    def _stamp(self, when: float) -> bytes:
+        second = int(when)
+        if second != self.last_second:
+            self.last_second = second
+            self.last_stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second)).encode()
+        return self.last_stamp + b".%03d " % int((when - second) * 1000)
+
+    def write(self, when: float, entries: list):
+        stamp = self._stamp(when)
+        data = memoryview(b"".join(stamp + stream.tag + line + b"\n" for stream, line in entries))
+        while data:
+            written = os.write(self.fd, data)
+            data = data[written:]
+
+    def close(self):
+        os.close(self.fd)
+
+
+class SyslogSink:
+    """Local syslog (or journald /dev/log) datagram socket, one datagram per line"""
+
+    def __init__(self, target: str):
+        self.address = target.partition(":")[2] or SYSLOG_SOCKET
+        self.socket = None
+
+    def write(self, when: float, entries: list):
+        stamp = time.strftime("%b %d %H:%M:%S", time.localtime(when)).encode()
+        try:
+            if self.socket is None:
+                self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                self.socket.connect(self.address)
+            for stream, line in entries:
+                self.socket.send(b"<%d>%s taskmaster: %s%s" % (stream.priority, stamp, stream.tag, line))
+        except OSError as e:
+            # Lines are dropped, the socket is opened again on the next batch
+            logging.info(f"log multiplexer : syslog '{self.address}' : {e}")
+            self.close()
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+
+class Stream:
+    __slots__ = ("tag", "sink", "priority", "buffer")
+
+    def __init__(self, name: str, sink, priority: int):
+        self.tag = f"{name} ".encode()
+        self.sink = sink
+        self.priority = priority
+        self.buffer = bytearray()
+
+
+class LogMultiplexer:
+    """
+        log_multiplex: the children write to pipes, one thread reads all of them (selectors),
+        cuts the output in lines tagged with the time and instance name and writes them
+        in batches: one fd per output file for the whole supervisor instead of one per child.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.lock = Lock()
+            cls._instance.sinks = {}
+            cls._instance.pending = []
+            cls._instance.selector = None
+            cls._instance.thread = None
+            cls._instance.stopping = False
+        return cls._instance
+
+    def _sink(self, target: str):
+        if target not in self.sinks:
+            self.sinks[target] = SyslogSink(target) if is_syslog_target(target) else FileSink(target)
+        return self.sinks[target]
+
+    def pipes(self, name: str, stdout: str, stderr: str) -> tuple:
+        """
+            Child stdout and stderr: a pipe write end, or os.devnull for no output.
+            Both streams share one pipe when they go to the same target.
+            The caller closes the write ends once the child is spawned, see release().
+        """
+        ends = {}
+        targets = []
+        with self.lock:
+            for target, priority in ((stdout, SYSLOG_INFO), (stderr, SYSLOG_ERR)):
+                if target is None:
+                    targets.append(os.devnull)
+                    continue
+                if target not in ends:
+                    stream = Stream(name, self._sink(target), priority)
+                    read_end, ends[target] = os.pipe()
+                    self.pending.append((read_end, stream))
+                targets.append(ends[target])
+            if ends:
+                self._wake()
+        return tuple(targets)
+
+    @staticmethod
+    def release(targets: tuple):
+        for fd in {target for target in targets if isinstance(target, int)}:
+            os.close(fd)
+
+    def _wake(self):
+        if self.thread is None:
+            self.selector = selectors.DefaultSelector()
+            self.wakeup_read, self.wakeup_write = os.pipe()
+            os.set_blocking(self.wakeup_write, False)
+            self.selector.register(self.wakeup_read, selectors.EVENT_READ)
+            self.thread = Thread(target=self._run, daemon=True)
+            self.thread.start()
+        try:
+            os.write(self.wakeup_write, b"\0")
+        except BlockingIOError:
+            # Already woken up
+            pass
+
+    def _read(self, fd: int, stream: Stream, batches: dict):
+        try:
+            data = os.read(fd, READ_SIZE)
+        except OSError:
+            data = b""
+        lines = batches.setdefault(stream.sink, [])
+        if not data:
+            # Every writer closed it: the process and its children exited
+            if stream.buffer:
+                lines.append((stream, bytes(stream.buffer)))
+            self.selector.unregister(fd)
+            os.close(fd)
+            return
+        stream.buffer += data
+        end = stream.buffer.rfind(b"\n")
+        if end >= 0:
+            lines.extend((stream, line) for line in stream.buffer[:end].split(b"\n"))
+            del stream.buffer[:end + 1]
+        if len(stream.buffer) >= MAX_LINE:
+            lines.append((stream, bytes(stream.buffer)))
+            stream.buffer.clear()
+
+    def _run(self):
+        while not self.stopping:
+            batches = {}
+            for key, _ in self.selector.select():
+                if key.fileobj == self.wakeup_read:
+                    os.read(self.wakeup_read, READ_SIZE)
+                    with self.lock:
+                        for fd, stream in self.pending:
+                            self.selector.register(fd, selectors.EVENT_READ, stream)
+                        self.pending = []
+                else:
+                    self._read(key.fileobj, key.data, batches)
+            when = Runtime().clock.time()
+            for sink, entries in batches.items():
+                if not entries:
+                    continue
+                try:
+                    sink.write(when, entries)
+                except OSError as e:
+                    logging.error(f"log multiplexer : write failed : {e}")
+
+    def stop(self):
+        """Flush the partial lines and close every pipe and sink"""
+        if self.thread is None:
+            return
+        with self.lock:
+            self.stopping = True
+            self._wake()
+        self.thread.join()
+        when = Runtime().clock.time()
+        for key in list(self.selector.get_map().values()):
+            if key.fileobj != self.wakeup_read:
+                if key.data.buffer:
+                    key.data.sink.write(when, [(key.data, bytes(key.data.buffer))])
+                os.close(key.fileobj)
+        for fd, _ in self.pending:
+            os.close(fd)
+        self.selector.close()
+        os.close(self.wakeup_read)
+        os.close(self.wakeup_write)
+        for sink in self.sinks.values():
+            sink.close()
+        self.sinks = {}
+        self.pending = []
+        self.thread = None
+        self.stopping = False
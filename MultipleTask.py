@@ -1,20 +1,63 @@
 from Task		import Task
-from SimpleTask import SimpleTask
-from typing     import List
+from SimpleTask import SimpleTask, RELOADABLE_SETTINGS, manage_print
+from typing     import Dict, List
+from State      import State, STOPPED_STATES, RUNNING_STATES
+from validate   import validate_program, finalize_program
+from Autoscale  import AutoscalePolicy
+from Runtime    import Runtime
+import logging
+
+def format_indexes(indexes: List[int]) -> str:
+    """[0, 1, 2, 5] -> '0-2,5'"""
+    ranges = []
+    for index in indexes:
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ",".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
 
 class MultiTask(Task):
-    def __init__(self, name: str, raw_config: dict):
+    def __init__(self, name: str, raw_config: dict, program: dict = None):
         self.name = name
         self.raw_config = raw_config
-        self.numprocs = raw_config.get("numprocs", 1)
-        self.tasks: List[SimpleTask] = []
+        # Instances are built from the template the first time they are started or addressed
+        self.materialized: Dict[int, SimpleTask] = {}
+        self.retiring: List[SimpleTask] = []
+        self.autoscaler: AutoscalePolicy = None
+        if program is None:
+            program = validate_program(name, raw_config)
+        # Validated once for the group, every instance shares it (env included)
+        self.template = finalize_program(program)
+        self.autostart = self.template["autostart"]
+        self.numprocs = program["numprocs"]
+
+        if program["autoscale"] is not None:
+            min_procs, max_procs = program["min_procs"], program["max_procs"]
+            self.numprocs = min(max(self.numprocs, min_procs), max_procs)
+            self.autoscaler = AutoscalePolicy(name, program["autoscale"], min_procs, max_procs)
+
+    def _instance(self, index: int) -> SimpleTask:
+        task = self.materialized.get(index)
+        if task is None:
+            task = SimpleTask._create({**self.template, "name": f"{self.name}:{index}", "index": index})
+            self.materialized[index] = task
+        return task
+
+    def _never_started_indexes(self) -> List[int]:
+        if len(self.materialized) == self.numprocs:
+            return []
+        return [index for index in range(self.numprocs) if index not in self.materialized]
 
-        for i in range(self.numprocs):
-            config_copy = dict(raw_config)
-            task = SimpleTask.create(f"{name}:{i}", config_copy)
-            if i == 0:
-                self.autostart = task.autostart
-            self.tasks.append(task)
+    def never_started(self) -> List[str]:
+        """Names of the instances never materialized, they are all NEVER_STARTED"""
+        return [f"{self.name}:{index}" for index in self._never_started_indexes()]
+
+    def _report_never_started(self):
+        indexes = self._never_started_indexes()
+        if indexes:
+            manage_print(f"{self.name}:[{format_indexes(indexes)}] : ERROR (not running)")
 
     def start(self) -> dict:
         # To keep return status for supervisor
@@ -22,8 +65,8 @@ class MultiTask(Task):
             "success": [],
             "errors": []
         }
-        for task in self.tasks:
-            result = task.start()
+        for index in range(self.numprocs):
+            result = self._instance(index).start()
             results["success"].extend(result["success"])
             results["errors"].extend(result["errors"])
         return results
@@ -33,18 +76,74 @@ class MultiTask(Task):
             "success": [],
             "errors": []
         }
-        for task in self.tasks:
+        self._report_never_started()
+        for task in self.instances():
             result = task.stop()
             results["success"].extend(result["success"])
             results["errors"].extend(result["errors"])
         return results
 
+    def _scale(self):
+        """Add or retire instances at the end of the range, running ones are never touched"""
+        if not any(task.processus_status in RUNNING_STATES for task in self.materialized.values()):
+            # Group stopped by the user: nothing to scale
+            return
+        now = Runtime().clock.time()
+        if not self.autoscaler.due(now):
+            # Most ticks: no sample due, the instances are not built
+            return
+        wanted = self.autoscaler.desired([self._instance(index) for index in range(self.numprocs)], now)
+        while self.numprocs < wanted:
+            task = self._instance(self.numprocs)
+            self.numprocs += 1
+            task.start()
+            logging.info(f"{task.name} added by autoscale")
+        while self.numprocs > wanted:
+            self.numprocs -= 1
+            task = self.materialized.pop(self.numprocs)
+            if task.processus_status not in STOPPED_STATES:
+                task.stop()
+                self.retiring.append(task)
+            logging.info(f"{task.name} retired by autoscale")
+
+    def signal(self, sig: int):
+        results = {
+            "success": [],
+            "errors": []
+        }
+        self._report_never_started()
+        for task in self.instances():
+            result = task.signal(sig)
+            results["success"].extend(result["success"])
+            results["errors"].extend(result["errors"])
+        return results
+
+    def apply(self, program: dict):
+        # Instances materialized later get the new settings from the template
+        self.template = {**self.template, **{key: program[key] for key in RELOADABLE_SETTINGS}}
+        self.autostart = self.template["autostart"]
+        for task in self.instances() + self.retiring:
+            task.apply(program)
+
     def supervise(self):
-        for task in self.tasks:
+        for task in self.materialized.values():
+            task.supervise()
+        for task in list(self.retiring):
             task.supervise()
+            if task.processus_status in STOPPED_STATES:
+                self.retiring.remove(task)
+        if self.autoscaler is not None:
+            self._scale()
 
     def status(self):
-        for task in self.tasks:
+        for task in self.instances():
+            task.status()
+        indexes = self._never_started_indexes()
+        if indexes:
+            # One line for every instance never started, however many there are
+            manage_print(f"{self.name + ':[' + format_indexes(indexes) + ']':<32}{State.NEVER_STARTED.name:<10}"
+                         f" {len(indexes)} instances")
+        for task in self.retiring:
             task.status()
 
     def shutdown(self):
@@ -52,18 +151,20 @@ class MultiTask(Task):
             "success": [],
             "errors": []
         }
-        for task in self.tasks:
+        for task in self.instances() + self.retiring:
             result = task.shutdown()
             results["success"].extend(result["success"])
             results["errors"].extend(result["errors"])
         return results
 
+    def instances(self) -> List[SimpleTask]:
+        """Materialized instances only, see never_started()"""
+        return [self.materialized[index] for index in sorted(self.materialized)]
+
     def get_subtask(self, task_id: str) -> SimpleTask:
-        for task in self.tasks:
-            main_name, task_id_subtask = task.name.split(":", 1)
-            if task_id_subtask == task_id:
-                return task
-        return None
+        if not task_id.isdigit() or int(task_id) >= self.numprocs or str(int(task_id)) != task_id:
+            return None
+        return self._instance(int(task_id))
 
     def get_subtask_names(self) -> List[str]:
-        return [task.name for task in self.tasks]
+        return [f"{self.name}:{index}" for index in range(self.numprocs)]
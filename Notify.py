@@ -0,0 +1,118 @@
+import os
+import socket
+import struct
+from threading  import Thread, Lock, Event
+
+NOTIFY_SOCKET = "/tmp/taskmaster-{pid}.notify"
+MESSAGE_SIZE = 4096
+UCRED = struct.Struct("3i")
+# Senders not registered yet (they notified before spawn() returned), only their latest fields are kept
+MAX_EARLY_SENDERS = 1024
+
+
+class NotifyServer:
+    """
+        sd_notify protocol: the programs with notify: true get NOTIFY_SOCKET in their
+        environment and send datagrams like "READY=1", "STATUS=...", "WATCHDOG=1".
+        The sender pid comes from SO_PASSCRED, its process group tells the instance,
+        so the workers forked by a program may notify too.
+        A task is registered from its spawn until it stops or exits.
+        The tasks only get flags, the supervise thread does the transitions: wakeup
+        is set when a message may change a state (READY=1) so it runs at once instead
+        of at the next tick, keepalives like WATCHDOG=1 never wake it.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.lock = Lock()
+            cls._instance.wakeup = Event()
+            cls._instance.tasks = {}
+            cls._instance.early = {}
+            cls._instance.server = None
+            cls._instance.path = None
+            cls._instance.thread = None
+            cls._instance.stop_event = Event()
+        return cls._instance
+
+    def socket_path(self) -> str:
+        """Opened on the first program that needs it"""
+        with self.lock:
+            if self.server is None:
+                self.path = NOTIFY_SOCKET.format(pid=os.getpid())
+                if os.path.exists(self.path):
+                    os.unlink(self.path)
+                self.server = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                self.server.setsockopt(socket.SOL_SOCKET, socket.SO_PASSCRED, 1)
+                self.server.bind(self.path)
+                os.chmod(self.path, 0o600)
+                self.server.settimeout(1)
+                self.thread = Thread(target=self._run, daemon=True)
+                self.thread.start()
+            return self.path
+
+    def register(self, pid: int, task):
+        with self.lock:
+            self.tasks[pid] = task
+            early = self.early.pop(pid, None)
+        if early is not None and task.notified(early):
+            self.wakeup.set()
+
+    def unregister(self, pid: int):
+        with self.lock:
+            self.tasks.pop(pid, None)
+
+    @staticmethod
+    def parse(data: bytes) -> dict:
+        fields = {}
+        for line in data.decode(errors="replace").splitlines():
+            key, sep, value = line.partition("=")
+            if sep:
+                fields[key] = value
+        return fields
+
+    def _run(self):
+        ancillary = socket.CMSG_SPACE(UCRED.size)
+        while not self.stop_event.is_set():
+            try:
+                data, ancdata, _, _ = self.server.recvmsg(MESSAGE_SIZE, ancillary)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            pid = None
+            for level, kind, cmsg in ancdata:
+                if level == socket.SOL_SOCKET and kind == socket.SCM_CREDENTIALS:
+                    pid = UCRED.unpack(cmsg[:UCRED.size])[0]
+            if not pid:
+                continue
+            try:
+                # Every program runs in its own session: pgid is the pid we spawned
+                group = os.getpgid(pid)
+            except OSError:
+                group = pid
+            fields = self.parse(data)
+            with self.lock:
+                task = self.tasks.get(group)
+                if task is None:
+                    # Merged: a sender that is never registered can't grow its entry
+                    if group in self.early or len(self.early) < MAX_EARLY_SENDERS:
+                        self.early.setdefault(group, {}).update(fields)
+                    continue
+            if task.notified(fields):
+                self.wakeup.set()
+
+    def stop(self):
+        with self.lock:
+            if self.server is None:
+                return
+            self.stop_event.set()
+        self.thread.join()
+        self.server.close()
+        self.server = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
@@ -0,0 +1,157 @@
+import os
+import ctypes
+import logging
+import platform
+from functools  import lru_cache
+
+NODE_DIR = "/sys/devices/system/node"
+CPU_DIR = "/sys/devices/system/cpu"
+# set_mempolicy(2) is not wrapped by the os module
+SET_MEMPOLICY = {"x86_64": 238, "aarch64": 237}.get(platform.machine())
+MPOL_INTERLEAVE = 3
+# Resolved once in the parent: dlopen in the child of a threaded process can deadlock
+_syscall = ctypes.CDLL(None, use_errno=True).syscall if SET_MEMPOLICY is not None else None
+
+
+def parse_cpulist(cpulist: str) -> list:
+    """'0-3,8' -> [0, 1, 2, 3, 8]"""
+    cpus = []
+    for part in cpulist.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def format_cpulist(cpus: list) -> str:
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path, "r") as file:
+            return file.read()
+    except OSError:
+        return ""
+
+
+def _sibling_rank(cpu: int) -> int:
+    """0 for the first hardware thread of a core, 1 for its SMT sibling..."""
+    siblings = parse_cpulist(_read(os.path.join(CPU_DIR, f"cpu{cpu}", "topology", "thread_siblings_list")))
+    return siblings.index(cpu) if cpu in siblings else 0
+
+
+@lru_cache(maxsize=None)
+def spread_order(cpus: tuple) -> tuple:
+    """CPUs of a node, the first hardware thread of every core first"""
+    return tuple(sorted(cpus, key=lambda cpu: (_sibling_rank(cpu), cpu)))
+
+
+@lru_cache(maxsize=None)
+def topology() -> tuple:
+    """((node, (cpus...)), ...) restricted to the CPUs the supervisor may use, one node without NUMA"""
+    allowed = os.sched_getaffinity(0)
+    nodes = []
+    try:
+        entries = sorted(int(entry[4:]) for entry in os.listdir(NODE_DIR)
+                         if entry.startswith("node") and entry[4:].isdigit())
+    except OSError:
+        entries = []
+    for node in entries:
+        cpus = [cpu for cpu in parse_cpulist(_read(os.path.join(NODE_DIR, f"node{node}", "cpulist"))) if cpu in allowed]
+        if cpus:
+            nodes.append((node, tuple(cpus)))
+    if not nodes:
+        nodes.append((0, tuple(sorted(allowed))))
+    return tuple(nodes)
+
+
+class Placement:
+    """CPUs and NUMA node of one instance, applied in the child before exec"""
+    __slots__ = ("cpus", "node", "interleave", "mask")
+
+    def __init__(self, cpus: list = None, node: int = None, interleave: list = None):
+        self.cpus = cpus
+        self.node = node
+        self.interleave = interleave
+        # set_mempolicy nodemask of interleave, built in the parent
+        self.mask = None
+
+    def apply(self):
+        """Runs in the forked child"""
+        if self.cpus:
+            os.sched_setaffinity(0, self.cpus)
+        if self.mask is not None:
+            interleave_memory(self.mask)
+
+    def __str__(self):
+        parts = []
+        if self.cpus:
+            parts.append(f"cpus {format_cpulist(self.cpus)}")
+        if self.node is not None:
+            parts.append(f"node {self.node}")
+        if self.interleave:
+            parts.append(f"interleave {format_cpulist(self.interleave)}")
+        return " ".join(parts)
+
+
+def place(index: int, cpu_affinity, numa: str) -> Placement:
+    """
+        Deterministic placement of instance index:
+            pack        one CPU each, in order: node 0 is filled first
+            spread      one CPU each, round robin over the nodes, one thread per core first
+            [cpus]      one CPU each from the list, round robin
+            numa local  confined to one node (the node of its CPU, or round robin)
+            interleave  memory interleaved over every node
+    """
+    if cpu_affinity is None and numa is None:
+        return None
+    nodes = topology()
+    node_of = {cpu: node for node, cpus in nodes for cpu in cpus}
+    placement = Placement()
+
+    if cpu_affinity == "pack":
+        ordered = [cpu for _, cpus in nodes for cpu in cpus]
+        placement.cpus = [ordered[index % len(ordered)]]
+    elif cpu_affinity == "spread":
+        _, cpus = nodes[index % len(nodes)]
+        cpus = spread_order(cpus)
+        placement.cpus = [cpus[(index // len(nodes)) % len(cpus)]]
+    elif isinstance(cpu_affinity, list):
+        placement.cpus = [cpu_affinity[index % len(cpu_affinity)]]
+
+    if numa == "local":
+        if placement.cpus:
+            placement.node = node_of.get(placement.cpus[0])
+        else:
+            placement.node, cpus = nodes[index % len(nodes)]
+            placement.cpus = list(cpus)
+    elif numa == "interleave" and len(nodes) > 1:
+        if SET_MEMPOLICY is None:
+            logging.info(f"numa interleave not supported on {platform.machine()}")
+        else:
+            placement.interleave = [node for node, _ in nodes]
+            placement.mask = node_mask(placement.interleave)
+    return placement
+
+
+def node_mask(nodes: list):
+    words = max(nodes) // 64 + 1
+    mask = (ctypes.c_ulong * words)()
+    for node in nodes:
+        mask[node // 64] |= 1 << (node % 64)
+    return mask
+
+
+def interleave_memory(mask):
+    """Runs in the forked child: no allocation, no dlopen"""
+    if _syscall(SET_MEMPOLICY, MPOL_INTERLEAVE, mask, len(mask) * 64 + 1) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"set_mempolicy: {os.strerror(errno)}")
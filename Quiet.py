@@ -1,17 +1,33 @@
+import threading
+
+
 class Quiet:
+    """
+        Silences manage_print in the thread that enabled it only (an update never mutes the shell).
+        Nested enable/disable pairs, given a list the silenced messages are collected into it.
+    """
     _instance = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            cls._instance._enabled = False
+            cls._instance._local = threading.local()
         return cls._instance
 
-    def enable(self):
-        self._enabled = True
+    def enable(self, messages: list = None):
+        self._local.depth = getattr(self._local, "depth", 0) + 1
+        if messages is not None:
+            self._local.messages = messages
 
     def disable(self):
-        self._enabled = False
+        self._local.depth = max(getattr(self._local, "depth", 0) - 1, 0)
+        if self._local.depth == 0:
+            self._local.messages = None
 
     def is_enabled(self):
-        return self._enabled
+        return getattr(self._local, "depth", 0) > 0
+
+    def collect(self, message: str):
+        messages = getattr(self._local, "messages", None)
+        if messages is not None:
+            messages.append(message)
@@ -0,0 +1,125 @@
+import os
+import time
+import signal
+import logging
+import subprocess
+from contextlib import ExitStack
+
+
+class SystemClock:
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    def wait(self, event, seconds: float):
+        """Sleep, or less when event is set"""
+        event.wait(seconds)
+
+
+class PopenBackend:
+    """Spawn real processes, the returned handle is the subprocess.Popen"""
+
+    def spawn(self, name: str, cmd: list, stdout: str, stderr: str, cwd: str, env: dict, umask: str,
+              cgroup: str = None, placement=None):
+        procs = None
+
+        # To avoid modif in parent
+        def set_child_umask():
+            os.umask(int(umask, 8))
+            if procs is not None:
+                # "0" is the writing process: the child joins the cgroup before exec
+                os.write(procs, b"0")
+            if placement is not None:
+                # CPUs and memory policy before exec: every thread of the program inherits them
+                placement.apply()
+
+        # stdout / stderr: a path opened in append mode or a pipe fd (log_multiplex)
+        with ExitStack() as files:
+            if cgroup is not None:
+                os.makedirs(cgroup, exist_ok=True)
+                # Opened in the parent, the forked child of a threaded process only writes
+                procs = os.open(os.path.join(cgroup, "cgroup.procs"), os.O_WRONLY)
+                files.callback(os.close, procs)
+            stdout_file = stdout if isinstance(stdout, int) else files.enter_context(open(stdout, "a"))
+            stderr_file = stderr if isinstance(stderr, int) else files.enter_context(open(stderr, "a"))
+            return subprocess.Popen(
+                cmd,
+                stdout=stdout_file,
+                stderr=stderr_file,
+                text=True,
+                cwd=cwd,
+                env=env,
+                start_new_session=True,
+                preexec_fn=set_child_umask
+            )
+
+    def signal_group(self, process: subprocess.Popen, sig: int):
+        """Children run in their own session: pgid == pid, the group outlives its leader"""
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            # pid reused by a process that is not ours anymore
+            process.send_signal(sig)
+
+    def group_alive(self, process: subprocess.Popen, cgroup: str = None) -> bool:
+        """True while a process of the group (or of the cgroup) is left, the leader may be gone"""
+        if cgroup is not None:
+            try:
+                with open(os.path.join(cgroup, "cgroup.procs"), "r") as procs:
+                    return procs.read().strip() != ""
+            except OSError:
+                pass
+        try:
+            os.killpg(process.pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # Someone is left in the group, just not ours to signal
+            pass
+        return True
+
+    def remove_cgroup(self, cgroup: str):
+        """The per instance cgroup, once its processes are gone"""
+        try:
+            os.rmdir(cgroup)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.info(f"can't remove cgroup '{cgroup}' : {e}")
+
+    def kill_group(self, process: subprocess.Popen, cgroup: str = None):
+        if cgroup is not None:
+            try:
+                # Kills every process of the cgroup, even the ones that left the group (setsid)
+                with open(os.path.join(cgroup, "cgroup.kill"), "w") as kill:
+                    kill.write("1")
+                return
+            except OSError as e:
+                logging.info(f"cgroup.kill failed on '{cgroup}' : {e}")
+        self.signal_group(process, signal.SIGKILL)
+
+
+class Runtime:
+    """
+        Clock and process backend used by the tasks and the supervisor.
+        Real ones by default, the simulation installs fake ones with use().
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.reset()
+        return cls._instance
+
+    def use(self, clock, backend):
+        self.clock = clock
+        self.backend = backend
+
+    def reset(self):
+        self.clock = SystemClock()
+        self.backend = PopenBackend()
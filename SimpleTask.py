@@ -4,19 +4,40 @@ import time
 import os
 import logging
 from Task       import Task
-from validate   import validate_task_config, Autorestart
+from validate   import validate_program, finalize_program, Autorestart
 from datetime   import timedelta
 from _io	    import TextIOWrapper
-from State      import State, STOPPED_STATES
+from State      import State, STOPPED_STATES, SIGNALLABLE_STATES
 from Quiet		import Quiet
+from Runtime     import Runtime
+from Events      import EventBus
+from History     import TransitionHistory
+from LogMux      import LogMultiplexer
+from Notify      import NotifyServer
+from Placement   import Placement, place
 
 TICK_RATE = 0.5
+# Settings a running process picks up without being respawned, see apply()
+RELOADABLE_SETTINGS = (
+    "autostart",
+    "autorestart",
+    "exitcodes",
+    "startretries",
+    "starttime",
+    "stopsignal",
+    "stoptime",
+    "reload_signal",
+    "ready_timeout",
+    "watchdog",
+)
 BACKOFF_DELAY = 2
 
 def	manage_print(message: str):
     print_mode = Quiet()
     if print_mode.is_enabled() == False:
         print(message)
+    else:
+        print_mode.collect(message)
 
 class SimpleTask(Task):
     name: str
@@ -34,6 +55,13 @@ class SimpleTask(Task):
     stdout: str
     stderr: str
     env: dict
+    cgroup: str
+    reload_signal: str
+    log_multiplex: bool
+    notify: bool
+    ready_timeout: int
+    watchdog: int
+    placement: Placement
     process: subprocess.Popen
     stdout_file: TextIOWrapper
     stderr_file: TextIOWrapper
@@ -62,24 +90,64 @@ class SimpleTask(Task):
         obj.stdout = config_dict["stdout"]
         obj.stderr = config_dict["stderr"]
         obj.env = config_dict["env"]
+        obj.cgroup = config_dict["cgroup"]
+        obj.reload_signal = config_dict["reload_signal"]
+        obj.log_multiplex = config_dict["log_multiplex"]
+        obj.notify = config_dict["notify"]
+        obj.ready_timeout = config_dict["ready_timeout"]
+        obj.watchdog = config_dict["watchdog"]
+        obj.ready = False
+        obj.notify_status = None
+        obj.watchdog_time = None
+        obj.killed = False
+        # Instances of a group are placed by their index, see Placement.place()
+        obj.placement = place(config_dict.get("index", 0), config_dict["cpu_affinity"], config_dict["numa"])
         obj.process = None
         obj.stdout_file = None
         obj.stderr_file = None
-        obj.processus_status = State.NEVER_STARTED
+        obj._processus_status = State.NEVER_STARTED
+        obj.status_seq = 0
+        obj.history = TransitionHistory()
         obj.retry = 0
         obj.processus_time_stop = None
+        obj.processus_time_start = None
         obj.raw_config = None
         obj.backoff_start_time = 0
         return obj
 
     @classmethod
-    def create(cls, name, raw_config):
-        validated = validate_task_config(name, raw_config)
-        return cls._create(validated)
+    def create(cls, name, raw_config, program=None):
+        if program is None:
+            program = validate_program(name, raw_config)
+        return cls._create(finalize_program(program))
+
+    @property
+    def processus_status(self) -> State:
+        return self._processus_status
+
+    @processus_status.setter
+    def processus_status(self, state: State):
+        # Every transition goes through here, the event bus sees all of them
+        previous = self._processus_status
+        self._processus_status = state
+        if state != previous:
+            # STARTING is set before the new process exists: the old return code is not its own
+            exitcode = self.process.returncode if self.process is not None and state != State.STARTING else None
+            self.history.record(Runtime().clock.time(), previous, state, exitcode)
+            self.status_seq = EventBus().publish(self.name, previous, state, exitcode)
+            if self.notify and self.process is not None and (state in STOPPED_STATES or state == State.BACKOFF):
+                # The process is gone, its pid may be reused by anyone
+                NotifyServer().unregister(self.process.pid)
 
     def __repr__(self):
         return f"<Task {self.name}: {self.cmd}>"
 
+    def release(self):
+        """The process exited: close its log files and remove its cgroup"""
+        self.close_redir()
+        if self.cgroup is not None:
+            Runtime().backend.remove_cgroup(self.cgroup_path())
+
     def close_redir(self):
         if self.stdout_file is not None:
             self.stdout_file.close()
@@ -96,29 +164,42 @@ class SimpleTask(Task):
             stdout_path = self.stdout if self.stdout is not None else os.devnull
             stderr_path = self.stderr if self.stderr is not None else os.devnull
             try:
-                with open(stdout_path, "a") as stdout_file, open(stderr_path, "a") as stderr_file:
-                    self.stdout_file = stdout_file
-                    self.stderr_file = stderr_file
+                runtime = Runtime()
+                self.processus_time_start = runtime.clock.time()
+                self.processus_status = State.STARTING
 
-                    self.processus_time_start = time.time()
-                    self.processus_status = State.STARTING
+                env = self.env
+                if self.notify:
+                    env = {**self.env, "NOTIFY_SOCKET": NotifyServer().socket_path()}
+                    if self.watchdog:
+                        env["WATCHDOG_USEC"] = str(self.watchdog * 1000000)
+                    if self.process is not None:
+                        NotifyServer().unregister(self.process.pid)
+                    self.ready = False
+                    self.notify_status = None
+                self.killed = False
 
-                    # To avoid modif in parent
-                    def set_child_umask():
-                        os.umask(int(self.umask, 8))
-
-                    self.process = subprocess.Popen(
+                if self.log_multiplex:
+                    # Pipes read by the supervisor, which tags and writes the lines
+                    stdout_path, stderr_path = LogMultiplexer().pipes(self.name, self.stdout, self.stderr)
+                try:
+                    self.process = runtime.backend.spawn(
+                        self.name,
                         self.cmd,
-                        stdout=self.stdout_file,
-                        stderr=self.stderr_file,
-                        text=True,
+                        stdout=stdout_path,
+                        stderr=stderr_path,
                         cwd=self.workingdir,
-                        env=self.env,
-                        start_new_session=True,
-                        preexec_fn=set_child_umask
+                        env=env,
+                        umask=self.umask,
+                        cgroup=self.cgroup_path(),
+                        placement=self.placement
                     )
-                    logging.info(f"{self.name} starting")
-                    return {"success": [self], "errors": []}
+                finally:
+                    LogMultiplexer.release((stdout_path, stderr_path))
+                if self.notify:
+                    NotifyServer().register(self.process.pid, self)
+                logging.info(f"{self.name} starting")
+                return {"success": [self], "errors": []}
             except (OSError, IOError, PermissionError) as e:
                 logging.info(f"{self.name} fatal : {e}")
                 self.processus_status = State.FATAL
@@ -133,95 +214,164 @@ class SimpleTask(Task):
             manage_print(f"{self.name} : ERROR (not running)") 
             return {"success": [], "errors": [self]}
 
-        signals = {
-            "TERM": signal.SIGTERM,
-            "KILL": signal.SIGKILL,
-            "INT" : signal.SIGINT,
-            "HUP" : signal.SIGHUP,
-            "USR1": signal.SIGUSR1,
-            "USR2": signal.SIGUSR2,
-            "QUIT": signal.SIGQUIT,
-        }
-        sig = signals.get(self.stopsignal)
+        sig = getattr(signal, f"SIG{self.stopsignal}")
         if self.process is None:
             self.processus_status = State.STOPPED
             return {"success": [], "errors": [self]}
-        self.process.send_signal(sig)
-        if self.process.poll() is not None:
+        # The whole process group, grandchildren included
+        Runtime().backend.signal_group(self.process, sig)
+        if self.group_exited():
             self.processus_status = State.STOPPED
             logging.info(f"{self.name} stopped")
-            self.close_redir()
+            self.release()
         else:
-            self.processus_time_stop = time.time()
+            self.processus_time_stop = Runtime().clock.time()
             self.processus_status = State.STOPPING
             logging.info(f"{self.name} stopping")
         return {"success": [self], "errors": []}
 
+    def signal(self, sig: int):
+        """Deliver sig to the process itself (not its group), it decides what to forward"""
+        if self.processus_status not in SIGNALLABLE_STATES or self.process is None:
+            manage_print(f"{self.name} : ERROR (not running)")
+            return {"success": [], "errors": [self]}
+        try:
+            self.process.send_signal(sig)
+        except OSError as e:
+            logging.info(f"{self.name} signal {sig} failed : {e}")
+            return {"success": [], "errors": [self]}
+        logging.info(f"{self.name} signalled {signal.Signals(sig).name}")
+        return {"success": [self], "errors": []}
+
+    def apply(self, program: dict):
+        for key in RELOADABLE_SETTINGS:
+            setattr(self, key, program[key])
+
+    def notified(self, fields: dict) -> bool:
+        """
+            sd_notify message, from the NotifyServer thread: only flags, supervise() acts on them.
+            Returns True when a transition may follow (first READY=1), the supervise thread is then woken.
+        """
+        wake = False
+        if fields.get("READY") == "1":
+            wake = not self.ready
+            self.ready = True
+        if "STATUS" in fields:
+            self.notify_status = fields["STATUS"]
+        if fields.get("WATCHDOG") == "1":
+            # Checked at the next tick, no need to wake for it
+            self.watchdog_time = Runtime().clock.time()
+        return wake
+
     def supervise(self):
         if self.process is not None:
             poll_state = self.process.poll()
             if self.processus_status == State.STARTING:
-                if poll_state is not None and poll_state not in self.exitcodes:
+                # With notify, exiting before READY=1 is a failed start whatever the code
+                if poll_state is not None and (poll_state not in self.exitcodes or self.notify):
                     if self.retry < self.startretries:
                         self.retry += 1
                         self.processus_status = State.BACKOFF
-                        self.backoff_start_time = time.time()
+                        self.backoff_start_time = Runtime().clock.time()
                         logging.info(f"{self.name} backoff")
-                        self.close_redir()
+                        self.release()
                     else:
                         self.processus_status = State.FATAL
                         logging.info(f"{self.name} fatal")
-                        self.close_redir()
-                elif time.time() - self.processus_time_start >= self.starttime:
+                        self.release()
+                elif self.notify:
+                    if self.ready:
+                        self.watchdog_time = Runtime().clock.time()
+                        self.processus_status = State.RUNNING
+                        logging.info(f"{self.name} running (ready)")
+                    elif (self.ready_timeout and not self.killed
+                          and Runtime().clock.time() - self.processus_time_start >= self.ready_timeout):
+                        # Killed: the next tick sees the exit and retries like a failed start
+                        logging.info(f"{self.name} not ready after {self.ready_timeout}s")
+                        self.killed = True
+                        self.kill()
+                elif Runtime().clock.time() - self.processus_time_start >= self.starttime:
                     self.processus_status = State.RUNNING
                     logging.info(f"{self.name} running")
 
             elif self.processus_status == State.BACKOFF:
-                if time.time() - self.backoff_start_time >= BACKOFF_DELAY:
+                if Runtime().clock.time() - self.backoff_start_time >= BACKOFF_DELAY:
                     self.start()
 
             elif self.processus_status == State.RUNNING:
+                if (poll_state is None and self.watchdog and not self.killed
+                        and Runtime().clock.time() - self.watchdog_time >= self.watchdog):
+                    # Hung: killed, the next tick handles it as an unexpected exit
+                    logging.info(f"{self.name} watchdog timeout")
+                    self.killed = True
+                    self.kill()
                 if poll_state is not None:
-                    self.close_redir()
+                    self.release()
                     
                     expected_exit = poll_state in self.exitcodes
                     
                     if expected_exit:
-                        self.processus_time_stop = time.time()
+                        self.processus_time_stop = Runtime().clock.time()
                         self.processus_status = State.EXITED
                         logging.info(f"{self.name} exited")
                         
                         if self.autorestart == Autorestart.ALWAYS:
                             self.retry = 0
                             self.processus_status = State.BACKOFF
-                            self.backoff_start_time = time.time()
+                            self.backoff_start_time = Runtime().clock.time()
                             logging.info(f"{self.name} backoff")
                     else:
                         if self.autorestart in [Autorestart.ALWAYS, Autorestart.UNEXPECTED]:
                             self.retry = 0
                             self.processus_status = State.BACKOFF
-                            self.backoff_start_time = time.time()
+                            self.backoff_start_time = Runtime().clock.time()
                             logging.info(f"{self.name} backoff")
                         else:
                             self.processus_status = State.FATAL
                             logging.info(f"{self.name} fatal")
             elif self.processus_status == State.STOPPING:
-                if poll_state is not None:
-                    self.close_redir()
-                    self.processus_status = State.STOPPED
-                    logging.info(f"{self.name} stopped")
-                elif time.time() - self.processus_time_stop >= self.stoptime:
-                    self.process.kill()
-                    self.close_redir()
-                    self.processus_status = State.STOPPED
-                    logging.info(f"{self.name} stopped")
+                self.reap()
+
+    def cgroup_path(self):
+        if self.cgroup is None:
+            return None
+        return os.path.join(self.cgroup, self.name.replace(":", "_"))
+
+    def kill(self):
+        Runtime().backend.kill_group(self.process, self.cgroup_path())
+
+    def group_exited(self) -> bool:
+        """The process and everything left in its group (or cgroup) exited"""
+        return self.process.poll() is not None and not Runtime().backend.group_alive(self.process, self.cgroup_path())
+
+    def reap(self, now: float = None):
+        """
+            STOPPING: STOPPED once the process and its whole group exited,
+            KILL the group after stoptime, even when only the leader is gone
+        """
+        if self.processus_status != State.STOPPING or self.process is None:
+            return
+        now = Runtime().clock.time() if now is None else now
+        if self.group_exited():
+            self.release()
+            self.processus_status = State.STOPPED
+            logging.info(f"{self.name} stopped")
+        elif now - self.processus_time_stop >= self.stoptime:
+            self.kill()
+            self.release()
+            self.processus_status = State.STOPPED
+            logging.info(f"{self.name} stopped")
 
     def status(self):
         buffer = f"{self.name:<32}{self.processus_status.name:<10}"
 
         if self.processus_status == State.RUNNING and self.process is not None:
-            uptime = timedelta(seconds=int(time.time() - self.processus_time_start))
+            uptime = timedelta(seconds=int(Runtime().clock.time() - self.processus_time_start))
             buffer += f"pid {self.process.pid}, uptime {uptime}"
+        if self.placement is not None:
+            buffer += f" ({self.placement})"
+        if self.notify_status is not None and self.processus_status in SIGNALLABLE_STATES:
+            buffer += f" [{self.notify_status}]"
         if self.processus_status == State.STOPPED or self.processus_status == State.EXITED:
             if self.processus_time_stop is not None:
                 stop_time = time.strftime("%b %d %I:%M %p", time.localtime(self.processus_time_stop))
@@ -230,6 +380,21 @@ class SimpleTask(Task):
                 buffer += f"Not started"
         manage_print(buffer)
 
+    def snapshot(self) -> dict:
+        """Status as data, for the control socket"""
+        running = self.processus_status in SIGNALLABLE_STATES and self.process is not None
+        return {
+            "name": self.name,
+            "state": self.processus_status.name,
+            "pid": self.process.pid if running else None,
+            "start": self.processus_time_start if running else None,
+            "stop": self.processus_time_stop,
+            "seq": self.status_seq,
+        }
+
+    def instances(self) -> list:
+        return [self]
+
     def shutdown(self):
         if self.processus_status in STOPPED_STATES:
             return {"success": [], "errors": [self]}
@@ -239,13 +404,13 @@ class SimpleTask(Task):
             return {"success": [], "errors": [self]}
         # Set new stoptime 
         self.stoptime = 2 
-        self.process.send_signal(signal.SIGTERM)
-        if self.process.poll() is not None:
+        Runtime().backend.signal_group(self.process, signal.SIGTERM)
+        if self.group_exited():
             self.processus_status = State.STOPPED
             logging.info(f"{self.name} shutdown complete")
-            self.close_redir()
+            self.release()
         else:
-            self.processus_time_stop = time.time()
+            self.processus_time_stop = Runtime().clock.time()
             self.processus_status = State.STOPPING
             logging.info(f"{self.name} shutting down")
         return {"success": [self], "errors": []}
\ No newline at end of file
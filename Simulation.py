@@ -0,0 +1,242 @@
+import re
+import signal
+import fnmatch
+import logging
+from datetime   import datetime
+from Runtime    import Runtime
+from Supervisor import Supervisor, TICK_RATE
+
+SIMULATION_EPOCH = 1_700_000_000.0
+LOG_LINE = re.compile(r"^(\S+ \S+) - \w+ - (\S+) (\w+)")
+DEATH_AFTER = {"running": ("backoff", "exited", "fatal")}
+
+
+class FakeClock:
+    """Time only moves when sleep() or advance() is called"""
+
+    def __init__(self, now: float = SIMULATION_EPOCH):
+        self.now = now
+        # Called after every sleep, the simulation runs a supervision tick there
+        self.on_sleep = None
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+        if self.on_sleep is not None:
+            self.on_sleep()
+
+    def wait(self, event, seconds: float):
+        # Nothing sets events in a simulation
+        self.sleep(seconds)
+
+
+class Behaviour:
+    """
+        How a fake process lives:
+            lifetime    seconds before it exits by itself with exitcode (None: forever)
+            stop_delay  seconds to exit once it got a non KILL signal (None: ignores it)
+            spawn_error raised by spawn, like a missing binary
+    """
+
+    def __init__(self, lifetime: float = None, exitcode: int = 0, stop_delay: float = 0, spawn_error: Exception = None):
+        self.lifetime = lifetime
+        self.exitcode = exitcode
+        self.stop_delay = stop_delay
+        self.spawn_error = spawn_error
+
+
+class FakeProcess:
+    def __init__(self, clock: FakeClock, name: str, pid: int, behaviour: Behaviour):
+        self.clock = clock
+        self.name = name
+        self.pid = pid
+        self.returncode = None
+        self.signals = []
+        self.exit_time = None
+        self.exit_code = None
+        if behaviour.lifetime is not None:
+            self._exit_at(clock.time() + behaviour.lifetime, behaviour.exitcode)
+        self.behaviour = behaviour
+
+    def _exit_at(self, when: float, code: int):
+        if self.exit_time is None or when < self.exit_time:
+            self.exit_time = when
+            self.exit_code = code
+
+    def poll(self):
+        if self.returncode is None and self.exit_time is not None and self.clock.time() >= self.exit_time:
+            self.returncode = self.exit_code
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.returncode is not None:
+            return
+        self.signals.append(sig)
+        if sig == signal.SIGKILL:
+            self._exit_at(self.clock.time(), -signal.SIGKILL)
+        elif self.behaviour.stop_delay is not None:
+            self._exit_at(self.clock.time() + self.behaviour.stop_delay, -sig)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def crash(self, code: int = 1):
+        self._exit_at(self.clock.time(), code)
+
+
+class FakeBackend:
+    """In-memory processes, behaviours are chosen by task name (fnmatch pattern)"""
+
+    def __init__(self, clock: FakeClock):
+        self.clock = clock
+        self.behaviours = []
+        self.processes = {}
+        self.spawned = 0
+        self.next_pid = 1000
+
+    def behave(self, pattern: str, behaviour: Behaviour):
+        # Last registered pattern wins
+        self.behaviours.insert(0, (pattern, behaviour))
+
+    def behaviour_for(self, name: str) -> Behaviour:
+        for pattern, behaviour in self.behaviours:
+            if fnmatch.fnmatchcase(name, pattern):
+                return behaviour
+        return Behaviour()
+
+    def spawn(self, name: str, cmd: list, stdout: str, stderr: str, cwd: str, env: dict, umask: str,
+              cgroup: str = None, placement=None):
+        behaviour = self.behaviour_for(name)
+        if behaviour.spawn_error is not None:
+            raise behaviour.spawn_error
+        self.next_pid += 1
+        self.spawned += 1
+        process = FakeProcess(self.clock, name, self.next_pid, behaviour)
+        self.processes[name] = process
+        return process
+
+    def signal_group(self, process: FakeProcess, sig: int):
+        process.send_signal(sig)
+
+    def group_alive(self, process: FakeProcess, cgroup: str = None) -> bool:
+        # Fake processes have no children
+        return process.poll() is None
+
+    def remove_cgroup(self, cgroup: str):
+        pass
+
+    def kill_group(self, process: FakeProcess, cgroup: str = None):
+        process.kill()
+
+    def crash(self, name: str, code: int = 1):
+        process = self.processes.get(name)
+        if process is not None:
+            process.crash(code)
+
+
+class Simulation:
+    """
+        Supervisor running on a fake clock and fake processes, nothing is forked.
+        Blocking calls (start, stop, shutdown) work: each of their sleeps runs a tick.
+    """
+
+    def __init__(self, path_to_config: str):
+        self.clock = FakeClock()
+        self.backend = FakeBackend(self.clock)
+        Runtime().use(self.clock, self.backend)
+        self.supervisor = Supervisor(use_config_cache=False)
+        self.supervisor.load_config(path_to_config)
+        self.clock.on_sleep = self.supervisor.tick
+        self.events = []
+        self.ticks = 0
+
+    def at(self, delay: float, action):
+        """Run action() once the simulated time reached now + delay"""
+        self.events.append((self.clock.time() + delay, action))
+        self.events.sort(key=lambda event: event[0])
+
+    def run(self, seconds: float):
+        end = self.clock.time() + seconds
+        while self.clock.time() < end:
+            while self.events and self.events[0][0] <= self.clock.time():
+                self.events.pop(0)[1]()
+            self.supervisor.tick()
+            self.ticks += 1
+            self.clock.advance(TICK_RATE)
+
+    def autostart(self):
+        with self.supervisor.lock:
+            for processus in self.supervisor.processus_list.values():
+                if processus.autostart == True:
+                    processus.start()
+
+    def close(self):
+        self.clock.on_sleep = None
+        Runtime().reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_log(path: str) -> list:
+    """(timestamp, process name, word) of the state lines of a taskmaster log"""
+    events = []
+    with open(path, "r") as file:
+        for line in file:
+            match = LOG_LINE.match(line)
+            if match is None:
+                continue
+            try:
+                when = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S,%f").timestamp()
+            except ValueError:
+                continue
+            events.append((when, match.group(2), match.group(3)))
+    return events
+
+
+def replay_log(sim: Simulation, path: str) -> dict:
+    """
+        Crash the fake processes when the logged ones died (running -> backoff/exited/fatal),
+        at the same offset from the first line, then run the simulation over the log period.
+        Returns the logged and simulated transitions count per word.
+    """
+    events = parse_log(path)
+    if not events:
+        return {"logged": {}, "simulated": {}}
+    origin = events[0][0]
+    last_word = {}
+    logged = {}
+    for when, name, word in events:
+        logged[word] = logged.get(word, 0) + 1
+        if last_word.get(name) in DEATH_AFTER and word in DEATH_AFTER[last_word[name]]:
+            sim.at(when - origin, lambda name=name: sim.backend.crash(name))
+        last_word[name] = word
+
+    simulated = {}
+
+    class Counter(logging.Handler):
+        def emit(self, record):
+            match = re.match(r"^(\S+) (\w+)", record.getMessage())
+            if match is not None:
+                simulated[match.group(2)] = simulated.get(match.group(2), 0) + 1
+
+    counter = Counter()
+    root = logging.getLogger()
+    previous_level = root.level
+    root.addHandler(counter)
+    root.setLevel(logging.INFO)
+    try:
+        sim.autostart()
+        sim.run(events[-1][0] - origin + TICK_RATE)
+    finally:
+        root.removeHandler(counter)
+        root.setLevel(previous_level)
+    return {"logged": logged, "simulated": simulated}
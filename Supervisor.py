@@ -1,25 +1,44 @@
-import yaml
 import sys
-import time
+import signal
 from typing     	import Dict, List
 from threading  	import Lock, Event
 from Task			import Task
 from MultipleTask   import MultiTask
 from State          import State, STOPPED_STATES 
 from Quiet			import Quiet
+from Runtime        import Runtime
+from SimpleTask     import RELOADABLE_SETTINGS
+from validate       import parse_signal
+from Events         import EventBus
+from Config         import ConfigCache, ConfigSet, ConfigError
+from History        import summarize, format_stats
+from Notify         import NotifyServer
 
 
 TICK_RATE = 0.5
+STOP_POLL_RATE = 0.05
 
 
 class Supervisor:
-    def __init__(self):
+    def __init__(self, use_config_cache: bool = True):
+        self.config_cache = ConfigCache() if use_config_cache else None
         self.processus_list: Dict[str, Task] = {}
         self.lock = Lock()
         self.path_to_config = None
+        self.config_set: ConfigSet = None
         self.new_processus_list: Dict[str, Task] = {}
         self.new_processus_to_start: Dict[str, Task] = {}
         self.old_processus_to_stop: List = []
+        self.processus_to_reload: Dict[str, tuple] = {}
+        # Changes when the set of programs changes, see snapshot()
+        self.config_generation = 0
+        self.reread_requested = Event()
+        # reread and update (shell, SIGHUP/watcher queue, control socket) run one at a time
+        self.config_lock = Lock()
+        # Set after every supervision pass, start() waits on it instead of a full TICK_RATE
+        self.ticked = Event()
+        self.name_index: List[str] = []
+        self.name_index_key = None
         self.print_mode: Quiet = Quiet()
 
     def _get_task_by_full_name(self, full_name: str):
@@ -30,6 +49,9 @@ class Supervisor:
             main_name, task_id = full_name.split(":", 1)
             if main_name in self.processus_list:
                 task = self.processus_list[main_name]
+                # group:* is every process of the group
+                if task_id == "*":
+                    return task
                 if isinstance(task, MultiTask):
                     return task.get_subtask(task_id)
                 return None
@@ -39,176 +61,359 @@ class Supervisor:
         return None
 
     def load_config(self, path_to_config: str):
+        self.config_set = ConfigSet(path_to_config, self.config_cache)
         try:
-            with open(path_to_config, 'r') as file:
-                config_data = yaml.safe_load(file)
-        except FileNotFoundError:
-            print(f"Error: file '{path_to_config}' not found.")
-            sys.exit(1)
-        except yaml.YAMLError as e:
-            print(f"Error while parsing YAML in '{path_to_config}': {e}")
-            sys.exit(1)
-
-        if not isinstance(config_data, dict) or "programs" not in config_data:
-            print("Error : configuration file must have a section 'programs:'")
+            self.config_set.refresh()
+            programs = self.config_set.programs()
+        except ConfigError as e:
+            print(f"Error: {e}")
             sys.exit(1)
 
         self.path_to_config = path_to_config
 
-        for name, config in config_data["programs"].items():
-            if ":" in name:
-                print(f"Error: invalid program name '{name}'. ':' is not allowed in program names.")
-                sys.exit(1)
+        for name, (config, program) in programs.items():
             try:
-                task = Task.create(name, config)  # Utiliser la factory
+                task = Task.create(name, config, program)  # Utiliser la factory
                 task.raw_config = config
                 self.processus_list[name] = task
             except Exception as e:
                 print(f"Error in task '{name}': {e}")
                 sys.exit(1)
 
-    def start(self, processus_names: List[str] = None, all: bool = None):
-        """Start and wait for processes to start"""
+    def _select_tasks(self, processus_names: List[str], all: bool, report=print) -> List[Task]:
+        if all:
+            return list(self.processus_list.values())
+        tasks = []
+        for full_name in processus_names:
+            task = self._get_task_by_full_name(full_name)
+            if task is None:
+                report(f"{full_name} : ERROR (no such process)")
+            else:
+                tasks.append(task)
+        return tasks
+
+    def start(self, processus_names: List[str] = None, all: bool = None, wait: bool = True,
+              report=print, progress=None, cancel: Event = None):
+        """
+            Start and wait for processes to start, wait=False returns the processes still starting.
+            progress(done, total) follows the wait, cancel stops waiting.
+        """
         waiting_list_of_starting_processus = []
-        tasks_to_start = []
-        
+
         with self.lock:
-            if all:
-                tasks_to_start = list(self.processus_list.values())
-            else:
-                for full_name in processus_names:
-                    task = self._get_task_by_full_name(full_name)
-                    if task is None:
-                        print(f"{full_name} : ERROR (no such process)")
-                    else:
-                        tasks_to_start.append(task)
-            
-            for task in tasks_to_start:
+            for task in self._select_tasks(processus_names, all, report):
                 results = task.start()
                 waiting_list_of_starting_processus.extend(results["success"])
 
-        while waiting_list_of_starting_processus:
+        total = len(waiting_list_of_starting_processus)
+        while wait and waiting_list_of_starting_processus and not (cancel is not None and cancel.is_set()):
+            self.ticked.clear()
             with self.lock:
-                for processus in waiting_list_of_starting_processus:
+                for processus in list(waiting_list_of_starting_processus):
                     if processus.processus_status in [State.RUNNING, State.BACKOFF]:
-                        print(f"{processus.name} : started")
+                        report(f"{processus.name} : started")
                         waiting_list_of_starting_processus.remove(processus)
                     elif processus.processus_status in STOPPED_STATES:
-                        print(f"{processus.name} : ERROR (spawn error)")
+                        report(f"{processus.name} : ERROR (spawn error)")
                         waiting_list_of_starting_processus.remove(processus)
-            time.sleep(TICK_RATE)
-        
+            if progress is not None:
+                progress(total - len(waiting_list_of_starting_processus), total)
+            if waiting_list_of_starting_processus:
+                Runtime().clock.wait(self.ticked, TICK_RATE)
+        return waiting_list_of_starting_processus
 
-    def stop(self, processus_names: List[str] = None, all: bool = None):
+    def stop(self, processus_names: List[str] = None, all: bool = None, wait: bool = True,
+             report=print, progress=None, cancel: Event = None):
+        """
+            Stop and wait for processes to stop, wait=False returns the processes still stopping.
+            progress(done, total) follows the wait, cancel stops waiting.
+        """
         waiting_list_of_processus_to_stop = []
-        tasks_to_stop = []
-        
+
         with self.lock:
-            if all:
-                tasks_to_stop = list(self.processus_list.values())
-            else:
-                for full_name in processus_names:
-                    task = self._get_task_by_full_name(full_name)
-                    if task is None:
-                        print(f"{full_name} : ERROR (no such process)")
-                    else:
-                        tasks_to_stop.append(task)
-            
-            for task in tasks_to_stop:
+            for task in self._select_tasks(processus_names, all, report):
                 results = task.stop()
                 waiting_list_of_processus_to_stop.extend(results["success"])
 
-        while waiting_list_of_processus_to_stop:
+        if wait:
+            return self._wait_stopped(waiting_list_of_processus_to_stop,
+                                      lambda processus: report(f"{processus.name} : stopped"), progress, cancel)
+        return waiting_list_of_processus_to_stop
+
+    def _wait_stopped(self, processes: List, on_stopped=None, progress=None, cancel: Event = None):
+        """
+            Every process was signalled in one pass, wait for all of them together:
+            each pass polls every remaining process and KILLs the groups past their stoptime.
+            It does not depend on the supervise thread. Returns the processes still stopping.
+        """
+        remaining = processes
+        while remaining and not (cancel is not None and cancel.is_set()):
             with self.lock:
-                for processus in waiting_list_of_processus_to_stop:
+                now = Runtime().clock.time()
+                still_stopping = []
+                for processus in remaining:
+                    processus.reap(now)
                     if processus.processus_status in STOPPED_STATES:
-                        print(f"{processus.name} : stopped")
-                        waiting_list_of_processus_to_stop.remove(processus)            
+                        if on_stopped is not None:
+                            on_stopped(processus)
+                    else:
+                        still_stopping.append(processus)
+                remaining = still_stopping
+            if progress is not None:
+                progress(len(processes) - len(remaining), len(processes))
+            if remaining:
+                Runtime().clock.sleep(STOP_POLL_RATE)
+        return remaining
+
+    def restart(self, processus_names: List[str] = None, all: bool = None,
+                report=print, progress=None, cancel: Event = None):
+        self.stop(processus_names, all, report=report, progress=progress, cancel=cancel)
+        if cancel is not None and cancel.is_set():
+            return
+        self.start(processus_names, all, report=report, progress=progress, cancel=cancel)
+
+    def request_reread(self):
+        """Safe from a signal handler or another thread: the supervise thread does the reread"""
+        self.reread_requested.set()
+
+    def names(self) -> List[str]:
+        """Program, group:* and process names, cached until the processes change"""
+        with self.lock:
+            key = (self.config_generation,
+                   sum(task.numprocs if isinstance(task, MultiTask) else 1 for task in self.processus_list.values()))
+            if key != self.name_index_key:
+                names = set()
+                for name, task in self.processus_list.items():
+                    names.add(name)
+                    if isinstance(task, MultiTask):
+                        names.add(f"{name}:*")
+                        names.update(task.get_subtask_names())
+                self.name_index = sorted(names)
+                self.name_index_key = key
+            return self.name_index
 
-    def restart(self, processus_names: List[str] = None, all: bool = None):
-        self.stop(processus_names, all)
-        self.start(processus_names, all)
+    def reread(self, report=print):
+        with self.config_lock:
+            self._reread(report)
 
-    def reread(self):
+    def _reread(self, report=print):
+        previous_files = dict(self.config_set.files)
         try:
-            with open(self.path_to_config, 'r') as file:
-                config_data = yaml.safe_load(file)
-        except FileNotFoundError:
-            print(f"Error: Can't REREAD file '{self.path_to_config}' not found.")
+            # Only the files modified since the last read are parsed and validated
+            changed_files = self.config_set.refresh()
+            programs = self.config_set.programs()
+        except ConfigError as e:
+            report(f"Error: Can't REREAD : {e}")
             return
-        except yaml.YAMLError as e:
-            print(f"Error:  Can't REREAD :  while parsing YAML in '{self.path_to_config}': {e}")
-            return
-        
-        if not isinstance(config_data, dict) or "programs" not in config_data:
-            print("Error :  Can't REREAD : configuration file must have a section programs:")
+
+        if not changed_files:
+            report(f"No config updates to processes")
             return
 
         with self.lock:
-            modification = False
-            for name, config in config_data["programs"].items():
+            # Staged first: an error keeps the previous config and the pending update untouched.
+            # Compared with what the pending update would apply, so two rereads before an update add up.
+            new_processus_list = {}
+            new_processus_to_start = {}
+            old_processus_to_stop = []
+            processus_to_reload = {}
+            messages = []
+            for name, (config, program) in programs.items():
+                live = self.processus_list.get(name)
+                staged = self.new_processus_list.get(name)
+                if name in self.processus_to_reload:
+                    pending = self.processus_to_reload[name][0]
+                elif staged is not None:
+                    pending = staged.raw_config
+                else:
+                    pending = live.raw_config if live is not None else None
+                # None: respawn, True: apply and send reload_signal, False: apply only
+                reload = self._reload_plan(live.raw_config, config, program) if live is not None else None
                 try:
-                    if name in self.processus_list:
-                        if config == self.processus_list[name].raw_config:
-                            self.new_processus_list[name] = self.processus_list[name]
+                    if staged is not None and config == pending:
+                        # Not modified since the last reread: its staging is kept
+                        new_processus_list[name] = staged
+                        if name in self.new_processus_to_start:
+                            new_processus_to_start[name] = staged
+                        if name in self.old_processus_to_stop:
+                            old_processus_to_stop.append(name)
+                        if name in self.processus_to_reload:
+                            processus_to_reload[name] = self.processus_to_reload[name]
+                    elif live is not None and config == live.raw_config:
+                        new_processus_list[name] = live
+                        if staged is not None:
+                            messages.append(f"{name}: changed (back to the running config)")
+                    elif live is not None and reload is not None:
+                        new_processus_list[name] = live
+                        processus_to_reload[name] = (config, program, reload)
+                        if reload:
+                            messages.append(f"{name}: changed (reload with SIG{program['reload_signal']})")
                         else:
-                            if name not in self.old_processus_to_stop:
-                                self.old_processus_to_stop.append(name)
-                            task = Task.create(name, config)
-                            self.new_processus_list[name] = task
-                            self.new_processus_to_start[name] = task
-                            self.new_processus_list[name].raw_config = config
-                            self.processus_list[name].raw_config = config
-                            modification = True
-                            print(f"{name}: changed")
+                            messages.append(f"{name}: changed (applied without restart)")
                     else:
-                        task = Task.create(name, config)
-                        self.new_processus_list[name] = task
-                        self.new_processus_to_start[name] = task
-                        modification = True
-                        print(f"{name}: available")
+                        task = Task.create(name, config, program)
+                        task.raw_config = config
+                        new_processus_list[name] = task
+                        new_processus_to_start[name] = task
+                        if live is not None:
+                            old_processus_to_stop.append(name)
+                            messages.append(f"{name}: changed")
+                        else:
+                            messages.append(f"{name}: available")
                 except Exception as e:
-                    print(f"Error :  Can't REREAD : in task '{name}': {e}")
+                    self.config_set.files = previous_files
+                    report(f"Error :  Can't REREAD : in task '{name}': {e}")
                     return
-            if modification == False:
-                print(f"No config updates to processes")
 
+            self.new_processus_list = new_processus_list
+            self.new_processus_to_start = new_processus_to_start
+            self.old_processus_to_stop = old_processus_to_stop
+            self.processus_to_reload = processus_to_reload
+            for message in messages:
+                report(message)
+            if not messages:
+                report(f"No config updates to processes")
+
+    @staticmethod
+    def _reload_plan(old_config: dict, new_config: dict, program: dict):
+        """
+            None when the process must be respawned, else whether reload_signal must be sent.
+            Supervision settings are applied silently. Keys taskmaster does not use are read by the
+            program itself: they are reloaded with the signal, if the running config already had one.
+        """
+        if not isinstance(old_config, dict):
+            return None
+        changed = {key for key in set(old_config) | set(new_config) if old_config.get(key) != new_config.get(key)}
+        app_changed = changed - set(program)
+        if not (changed - app_changed) <= set(RELOADABLE_SETTINGS):
+            return None
+        if not app_changed:
+            return False
+        if program["reload_signal"] is None or old_config.get("reload_signal") is None:
+            return None
+        return True
 
-    def update(self):
+    def update(self, report=print):
+        with self.config_lock:
+            self._update(report)
+
+    def _update(self, report=print):
+        if self.new_processus_list == {}:
+            return
         autostart = []
         self.print_mode.enable()
-        # Stop process delete from config
-        if not self.new_processus_list == {}:
-            for name, processus in self.processus_list.items():
-                if name not in self.new_processus_list:
-                    processus.stop()
-
-            # Stop process 
-            if self.old_processus_to_stop:
-                self.stop(self.old_processus_to_stop)  
- 
-            # Autostart of ew process
+        try:
+            # Processes removed from the config and changed ones are stopped together
+            to_stop = [name for name in self.processus_list if name not in self.new_processus_list]
+            to_stop += [name for name in self.old_processus_to_stop if name not in to_stop]
+
+            # Apply in place and let the processes reload their own config
+            with self.lock:
+                for name, (config, program, send) in self.processus_to_reload.items():
+                    task = self.processus_list[name]
+                    task.raw_config = config
+                    task.apply(program)
+                    if send:
+                        task.signal(getattr(signal, f"SIG{program['reload_signal']}"))
+            self.processus_to_reload = {}
+
+            if to_stop:
+                self.stop(to_stop, report=report)
+
+            # Autostart of new process
             for name, new_processus in self.new_processus_to_start.items():
                 if new_processus.autostart == True:
                     autostart.append(name)
-            self.processus_list = self.new_processus_list
+            with self.lock:
+                self.processus_list = self.new_processus_list
+                self.config_generation += 1
             self.old_processus_to_stop = []
             self.new_processus_to_start = {}
             self.new_processus_list = {}
-            self.start(autostart)
+            self.start(autostart, report=report)
+        finally:
             self.print_mode.disable()
 
+    def signal(self, signal_name: str, processus_names: List[str] = None, all: bool = None):
+        """Deliver a signal in one batch to every matching process in SIGNALLABLE_STATES"""
+        sig = parse_signal(signal_name)
+        if sig is None:
+            print(f"{signal_name} : ERROR (bad signal name)")
+            return {"success": [], "errors": []}
+        results = {"success": [], "errors": []}
+        with self.lock:
+            for task in self._select_tasks(processus_names, all):
+                result = task.signal(sig)
+                results["success"].extend(result["success"])
+                results["errors"].extend(result["errors"])
+        for processus in results["success"]:
+            print(f"{processus.name} : signalled")
+        return results
+
+    def snapshot(self, since: int = None, generation: int = None) -> dict:
+        """
+            Status of every process as data. With since and the generation of a previous
+            snapshot, only the processes whose state changed after since are returned.
+        """
+        with self.lock:
+            processes = [processus for task in self.processus_list.values() for processus in task.instances()]
+            never_started = [name for task in self.processus_list.values() if isinstance(task, MultiTask)
+                             for name in task.never_started()]
+            full = since is None or generation != self.config_generation
+            snapshots = [processus.snapshot() for processus in processes if full or processus.status_seq > since]
+            if full:
+                # Instances not materialized yet: nothing changes until they start (seq 0)
+                snapshots += [{"name": name, "state": State.NEVER_STARTED.name, "pid": None,
+                               "start": None, "stop": None, "seq": 0} for name in never_started]
+            return {
+                "seq": EventBus().seq,
+                "generation": self.config_generation,
+                "full": full,
+                "count": len(processes) + len(never_started),
+                "processes": snapshots,
+            }
+
+    def stats(self, processus_names: List[str] = None, all: bool = None) -> List[tuple]:
+        """
+            Restart rate, MTBF and time per state of each program, group or process,
+            from the history rings. With all, the most flapping programs come first.
+        """
+        with self.lock:
+            now = Runtime().clock.time()
+            rows = [(task.name, summarize([processus.history.stats(now) for processus in task.instances()]))
+                    for task in self._select_tasks(processus_names, all)]
+        if all:
+            rows.sort(key=lambda row: (-row[1]["restart_rate"], row[0]))
+        for name, stats in rows:
+            print(format_stats(name, stats))
+        return rows
+
+    def tick(self):
+        """One supervision pass over every process"""
+        with self.lock:
+            for processus in self.processus_list.values():
+                processus.supervise()
+        self.ticked.set()
+
     def supervise(self, event: Event):
         try:
             with self.lock:
                 for processus in self.processus_list.values():
                     if processus.autostart == True:
                         processus.start()
+            # A READY=1 notify message wakes the loop up before the end of the tick
+            wakeup = NotifyServer().wakeup
             while not event.is_set():
-                with self.lock:
-                    for processus in self.processus_list.values():
-                        processus.supervise()
-                time.sleep(TICK_RATE)
+                wakeup.clear()
+                # Never waits for a shell update (it can take a whole stoptime): retried next tick
+                if self.reread_requested.is_set() and self.config_lock.acquire(blocking=False):
+                    try:
+                        self.reread_requested.clear()
+                        self._reread()
+                    finally:
+                        self.config_lock.release()
+                self.tick()
+                Runtime().clock.wait(wakeup, TICK_RATE)
         except KeyboardInterrupt:
             return
 
@@ -227,23 +432,16 @@ class Supervisor:
     
 
     def shutdown(self):
+        waiting_list_of_processus_to_shutdown = []
         try:
-            waiting_list_of_processus_to_shutdown = []
-            
             with self.lock:
-
                 for task in self.processus_list.values():
                     results = task.shutdown()
                     waiting_list_of_processus_to_shutdown.extend(results["success"])
 
-            while waiting_list_of_processus_to_shutdown:
-                with self.lock:
-                    for processus in waiting_list_of_processus_to_shutdown:
-                        if processus.processus_status in STOPPED_STATES:
-                            waiting_list_of_processus_to_shutdown.remove(processus)
+            self._wait_stopped(waiting_list_of_processus_to_shutdown)
         except KeyboardInterrupt:
             for processus in waiting_list_of_processus_to_shutdown:
                 processus.close_redir()
-                processus.process.kill()
+                processus.kill()
             return
-        
\ No newline at end of file
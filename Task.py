@@ -1,19 +1,23 @@
 from abc            import ABC, abstractmethod
-from validate       import validate_numprocs
+from validate       import validate_program
 
 class Task(ABC):
     """Abstract Method for Multiple and Simple Task"""
     
     @staticmethod
-    def create(name: str, raw_config: dict):
+    def create(name: str, raw_config: dict, program: dict = None):
+        """program is the output of validate_program, when it is already known (config cache)"""
         # Import in method to avoid circular inclusion
         from MultipleTask   import MultiTask
         from SimpleTask     import SimpleTask
-        numprocs = validate_numprocs(name, raw_config)
-        if numprocs > 1:
-            return MultiTask(name, raw_config)
+        if program is None:
+            program = validate_program(name, raw_config)
+        numprocs = program["numprocs"]
+        # Autoscaled programs are groups even when they start with one instance
+        if numprocs > 1 or program["autoscale"] is not None:
+            return MultiTask(name, raw_config, program)
         else:
-            return SimpleTask.create(name, raw_config)
+            return SimpleTask.create(name, raw_config, program)
     
     @abstractmethod
     def start(self): pass
@@ -29,3 +33,12 @@ class Task(ABC):
 
     @abstractmethod
     def shutdown(self): pass
+
+    @abstractmethod
+    def signal(self, sig: int): pass
+
+    @abstractmethod
+    def apply(self, program: dict): pass
+
+    @abstractmethod
+    def instances(self) -> list: pass
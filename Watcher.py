@@ -0,0 +1,103 @@
+import os
+import ctypes
+import ctypes.util
+import select
+import struct
+import fnmatch
+import logging
+from threading  import Thread, Event
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_MODIFY
+
+EVENT_HEADER = struct.Struct("iIII")
+DEBOUNCE_DELAY = 0.5
+
+
+class ConfigWatcher:
+    """
+        Watch the directories of the config files with inotify and call on_change
+        once a burst of edits is over (no event during DEBOUNCE_DELAY).
+    """
+
+    def __init__(self, config_set, on_change, debounce: float = DEBOUNCE_DELAY):
+        libc_name = ctypes.util.find_library("c")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify is not available on this system")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.config_set = config_set
+        self.on_change = on_change
+        self.debounce = debounce
+        self.watches = {}
+        self.stop_event = Event()
+        self.thread = Thread(target=self._run, daemon=True)
+
+    def _patterns(self) -> list:
+        return [self.config_set.path] + self.config_set.include_patterns()
+
+    def _sync_watches(self):
+        """Watch every directory holding a config file, includes may have changed"""
+        directories = {os.path.dirname(pattern) for pattern in self._patterns()}
+        for directory in directories:
+            if directory in self.watches.values() or not os.path.isdir(directory):
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, directory.encode(), WATCH_MASK)
+            if wd < 0:
+                logging.info(f"config watcher : can't watch '{directory}' : {os.strerror(ctypes.get_errno())}")
+                continue
+            self.watches[wd] = directory
+
+    def _read_events(self) -> bool:
+        """Drain pending events, True if one of them concerns a config file"""
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return False
+        patterns = self._patterns()
+        relevant = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            path = os.path.join(self.watches.get(wd, ""), name)
+            if any(fnmatch.fnmatch(path, pattern) for pattern in patterns):
+                relevant = True
+        return relevant
+
+    def _run(self):
+        pending = False
+        while not self.stop_event.is_set():
+            # Wait for the first event, then until the burst is over
+            timeout = self.debounce if pending else 1
+            readable, _, _ = select.select([self.fd], [], [], timeout)
+            if readable:
+                pending = self._read_events() or pending
+                continue
+            if pending:
+                pending = False
+                try:
+                    self.on_change()
+                except Exception as e:
+                    logging.error(f"config watcher : {e}")
+                self._sync_watches()
+
+    def start(self):
+        self._sync_watches()
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        os.close(self.fd)
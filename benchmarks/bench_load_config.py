@@ -0,0 +1,68 @@
+"""
+    Cold and warm Supervisor.load_config on a synthetic config.
+
+    python3 benchmarks/bench_load_config.py [--programs 1000] [--numprocs 50]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Supervisor import Supervisor
+from Config     import ConfigCache
+
+
+def write_config(path: str, programs: int, numprocs: int, workdir: str):
+    with open(path, "w") as file:
+        file.write("programs:\n")
+        for i in range(programs):
+            file.write(
+                f"  prog_{i}:\n"
+                f"    cmd: \"/bin/sleep 1000\"\n"
+                f"    numprocs: {numprocs}\n"
+                f"    autostart: false\n"
+                f"    workingdir: {workdir}\n"
+                f"    stopsignal: TERM\n"
+                f"    stdout: {workdir}/prog_{i % 10}.out\n"
+                f"    stderr: {workdir}/prog_{i % 10}.err\n"
+                f"    env:\n"
+                f"      INDEX: \"{i}\"\n"
+            )
+
+
+def timed_load(path: str, cache_dir: str, use_cache: bool) -> float:
+    supervisor = Supervisor(use_config_cache=use_cache)
+    if use_cache:
+        supervisor.config_cache = ConfigCache(cache_dir)
+    start = time.perf_counter()
+    supervisor.load_config(path)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load_config benchmark")
+    parser.add_argument("--programs", type=int, default=1000)
+    parser.add_argument("--numprocs", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "config.yml")
+        cache_dir = os.path.join(workdir, "cache")
+        write_config(path, args.programs, args.numprocs, workdir)
+        print(f"{args.programs} programs x {args.numprocs} procs = {args.programs * args.numprocs} processes")
+
+        uncached = min(timed_load(path, cache_dir, False) for _ in range(args.repeat))
+        cold = timed_load(path, cache_dir, True)
+        warm = min(timed_load(path, cache_dir, True) for _ in range(args.repeat))
+
+        print(f"{'no cache':<12}{uncached * 1000:>10.1f} ms")
+        print(f"{'cold cache':<12}{cold * 1000:>10.1f} ms")
+        print(f"{'warm cache':<12}{warm * 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
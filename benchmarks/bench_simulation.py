@@ -0,0 +1,129 @@
+"""
+    Lifecycle scenarios on the fake clock / fake processes, faster than real time.
+
+    python3 benchmarks/bench_simulation.py --scenarios 3000 [--seed 42]
+    python3 benchmarks/bench_simulation.py --replay /tmp/taskmaster.log --config config.yml
+"""
+import io
+import os
+import sys
+import time
+import random
+import signal
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Simulation import Simulation, Behaviour, replay_log, SIMULATION_EPOCH
+from State      import State
+
+
+def write_config(path: str, cmd: str, **options):
+    with open(path, "w") as file:
+        file.write("programs:\n  sim:\n")
+        file.write(f"    cmd: \"{cmd}\"\n")
+        file.write("    autostart: false\n")
+        for key, value in options.items():
+            file.write(f"    {key}: {value}\n")
+
+
+def crash_loop(path: str, rng: random.Random):
+    """Dies before starttime at every try: FATAL after startretries + 1 spawns"""
+    retries = rng.randint(0, 5)
+    write_config(path, "/bin/crash", startretries=retries, starttime=rng.randint(1, 5))
+    with Simulation(path) as sim:
+        sim.backend.behave("sim", Behaviour(lifetime=rng.uniform(0, 0.9), exitcode=1))
+        sim.supervisor.start(["sim"], wait=False)
+        sim.run(retries * 4 + 10)
+        task = sim.supervisor.processus_list["sim"]
+        assert task.processus_status == State.FATAL, task.processus_status
+        assert sim.backend.spawned == retries + 1, sim.backend.spawned
+
+
+def slow_stop(path: str, rng: random.Random):
+    """Ignores the stop signal: KILLed once stoptime is over"""
+    stoptime = rng.randint(1, 30)
+    write_config(path, "/bin/stubborn", stoptime=stoptime, starttime=0)
+    with Simulation(path) as sim:
+        sim.backend.behave("sim", Behaviour(stop_delay=None))
+        sim.supervisor.start(["sim"])
+        process = sim.backend.processes["sim"]
+        before = sim.clock.time()
+        sim.supervisor.stop(["sim"])
+        assert sim.supervisor.processus_list["sim"].processus_status == State.STOPPED
+        assert signal.SIGKILL in process.signals or process.returncode == -signal.SIGKILL
+        assert sim.clock.time() - before >= stoptime
+
+
+def reread_during_stop(path: str, rng: random.Random):
+    """Config changed while the old process is still stopping: update runs the new command"""
+    write_config(path, "/bin/old", stoptime=rng.randint(2, 10), starttime=0, autostart="true")
+    with Simulation(path) as sim:
+        sim.backend.behave("sim", Behaviour(stop_delay=rng.uniform(0.5, 20)))
+        sim.autostart()
+        sim.run(2)
+        sim.supervisor.stop(["sim"], wait=False)
+        write_config(path, "/bin/new", stoptime=1, starttime=0, autostart="true")
+        # Keep the size different so the mtime/size check can't miss it
+        with open(path, "a") as file:
+            file.write("# " + "x" * rng.randint(1, 10) + "\n")
+        sim.supervisor.reread()
+        sim.supervisor.update()
+        sim.run(2)
+        task = sim.supervisor.processus_list["sim"]
+        assert task.cmd == ["/bin/new"], task.cmd
+        assert task.processus_status == State.RUNNING, task.processus_status
+
+
+SCENARIOS = [crash_loop, slow_stop, reread_during_stop]
+
+
+def run_scenarios(count: int, seed: int):
+    rng = random.Random(seed)
+    failures = {}
+    wall_start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "sim.yml")
+        for i in range(count):
+            scenario = SCENARIOS[i % len(SCENARIOS)]
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    scenario(path, rng)
+            except AssertionError as e:
+                failures.setdefault(scenario.__name__, []).append(f"#{i}: {e}")
+    wall = time.perf_counter() - wall_start
+
+    print(f"{count} scenarios in {wall:.2f}s ({count / wall:.0f}/s), seed {seed}")
+    for name, errors in failures.items():
+        print(f"  {name}: {len(errors)} failed, first {errors[0]}")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic lifecycle simulation")
+    parser.add_argument("--scenarios", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--replay", help="taskmaster log to replay")
+    parser.add_argument("--config", help="config used with --replay")
+    args = parser.parse_args()
+
+    if args.replay:
+        if not args.config:
+            parser.error("--replay requires --config")
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), Simulation(args.config) as sim:
+            counts = replay_log(sim, args.replay)
+            simulated = sim.clock.time() - SIMULATION_EPOCH
+        wall = time.perf_counter() - start
+        print(f"replayed {simulated:.0f}s of log in {wall:.2f}s")
+        for word in sorted(set(counts["logged"]) | set(counts["simulated"])):
+            print(f"  {word:<12}logged {counts['logged'].get(word, 0):>8}  simulated {counts['simulated'].get(word, 0):>8}")
+        return
+
+    sys.exit(0 if run_scenarios(args.scenarios, args.seed) else 1)
+
+
+if __name__ == "__main__":
+    main()
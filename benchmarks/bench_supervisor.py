@@ -0,0 +1,235 @@
+"""
+    Load test of the Supervisor on synthetic configs.
+
+    python3 benchmarks/bench_supervisor.py --programs 10 --numprocs 100 -o results.json
+    python3 benchmarks/bench_supervisor.py --programs 10 --numprocs 100 --compare results.json
+
+    Each scenario runs N programs x numprocs cheap children:
+        sleep       /bin/sleep, spawn / RUNNING / stop / shutdown / status / RSS / tick CPU
+        crash       SIGKILL sent to RUNNING sleeps, time until the supervisor notices
+        crashloop   instant exit 1 with autorestart, tick CPU while restarting
+        ignoreterm  SIGTERM ignored, stop latency is bounded by stoptime
+"""
+import io
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import subprocess
+import contextlib
+from threading  import Thread, Event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Supervisor import Supervisor
+from State      import State
+
+PROGRAMS = {
+    "sleep": {"cmd": "/bin/sleep 1000"},
+    "crash": {"cmd": "/bin/sleep 1000", "autorestart": "never"},
+    "crashloop": {"cmd": "/bin/sh -c 'exit 1'", "autorestart": "unexpected", "startretries": 1000000},
+    "ignoreterm": {"cmd": "/bin/sh -c 'trap \"\" TERM; while :; do sleep 1; done'", "stoptime": 1},
+}
+POLL_RATE = 0.01
+
+
+def rss_kb() -> int:
+    with open("/proc/self/status", "r") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def write_config(path: str, kind: str, programs: int, numprocs: int):
+    with open(path, "w") as file:
+        file.write("programs:\n")
+        for i in range(programs):
+            file.write(f"  {kind}_{i}:\n")
+            file.write(f"    numprocs: {numprocs}\n")
+            file.write(f"    autostart: false\n")
+            file.write(f"    starttime: 0\n")
+            for key, value in PROGRAMS[kind].items():
+                file.write(f"    {key}: {json.dumps(value)}\n")
+
+
+def all_processes(supervisor: Supervisor) -> list:
+    processes = []
+    for task in supervisor.processus_list.values():
+        processes.extend(task.instances())
+    return processes
+
+
+def wait_for(processes: list, predicate, timeout: float) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if all(predicate(process) for process in processes):
+            break
+        time.sleep(POLL_RATE)
+    return time.perf_counter() - start
+
+
+def tick_cpu(supervisor: Supervisor, ticks: int) -> float:
+    """Mean CPU time (ms) of one Supervisor.tick(), this thread only (not the probe / log / notify threads)"""
+    total = 0.0
+    for _ in range(ticks):
+        start = time.thread_time()
+        supervisor.tick()
+        total += time.thread_time() - start
+        time.sleep(POLL_RATE)
+    return total / ticks * 1000
+
+
+class Bench:
+    def __init__(self, workdir: str, kind: str, programs: int, numprocs: int):
+        self.path = os.path.join(workdir, f"{kind}.yml")
+        write_config(self.path, kind, programs, numprocs)
+        self.rss_before = rss_kb()
+        self.supervisor = Supervisor(use_config_cache=False)
+        self.supervisor.load_config(self.path)
+        self.processes = []
+        self.event = Event()
+        self.thread = Thread(target=self.supervisor.supervise, args=(self.event,))
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def spawn(self) -> float:
+        with self.supervisor.lock:
+            start = time.perf_counter()
+            for task in self.supervisor.processus_list.values():
+                task.start()
+            elapsed = time.perf_counter() - start
+            # Instances are materialized by their first start
+            self.processes = all_processes(self.supervisor)
+            return elapsed
+
+    def __exit__(self, *exc):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.supervisor.shutdown()
+        self.event.set()
+        self.thread.join()
+
+
+def run_sleep(workdir: str, programs: int, numprocs: int) -> dict:
+    count = programs * numprocs
+    with Bench(workdir, "sleep", programs, numprocs) as bench:
+        spawn = bench.spawn()
+        running = wait_for(bench.processes, lambda p: p.processus_status == State.RUNNING, 120)
+        rss = (rss_kb() - bench.rss_before) / count
+        cpu = tick_cpu(bench.supervisor, 20)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            bench.supervisor.status(all=True)
+            status = time.perf_counter() - start
+            start = time.perf_counter()
+            bench.supervisor.stop(all=True)
+            stop = time.perf_counter() - start
+            bench.supervisor.start(all=True)
+            start = time.perf_counter()
+            bench.supervisor.shutdown()
+            shutdown = time.perf_counter() - start
+    return {
+        "processes": count,
+        "spawn_per_s": count / spawn,
+        "time_to_all_running_s": running,
+        "supervisor_cpu_per_tick_ms": cpu,
+        "rss_per_process_kb": rss,
+        "status_all_ms": status * 1000,
+        "stop_all_s": stop,
+        "shutdown_s": shutdown,
+    }
+
+
+def run_crash(workdir: str, programs: int, numprocs: int) -> dict:
+    with Bench(workdir, "crash", programs, numprocs) as bench:
+        bench.spawn()
+        wait_for(bench.processes, lambda p: p.processus_status == State.RUNNING, 120)
+        for process in bench.processes:
+            os.kill(process.process.pid, signal.SIGKILL)
+        latency = wait_for(bench.processes, lambda p: p.processus_status != State.RUNNING, 120)
+    return {"crash_detection_s": latency}
+
+
+def run_crashloop(workdir: str, programs: int, numprocs: int) -> dict:
+    with Bench(workdir, "crashloop", programs, numprocs) as bench:
+        bench.spawn()
+        time.sleep(1)
+        cpu = tick_cpu(bench.supervisor, 20)
+    return {"crashloop_cpu_per_tick_ms": cpu}
+
+
+def run_ignoreterm(workdir: str, programs: int, numprocs: int) -> dict:
+    with Bench(workdir, "ignoreterm", programs, numprocs) as bench:
+        bench.spawn()
+        wait_for(bench.processes, lambda p: p.processus_status == State.RUNNING, 120)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            bench.supervisor.stop(all=True)
+            stop = time.perf_counter() - start
+    return {"stop_ignoring_term_s": stop}
+
+
+SCENARIOS = {
+    "sleep": run_sleep,
+    "crash": run_crash,
+    "crashloop": run_crashloop,
+    "ignoreterm": run_ignoreterm,
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(results: dict, path: str):
+    with open(path, "r") as file:
+        previous = json.load(file)
+    print(f"\ncompared to {previous.get('commit') or path}:")
+    for key, value in results["metrics"].items():
+        old = previous.get("metrics", {}).get(key)
+        if not old:
+            continue
+        print(f"  {key:<32}{old:>12.3f} -> {value:>12.3f}  ({(value - old) / old * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Supervisor load test")
+    parser.add_argument("--programs", type=int, default=10)
+    parser.add_argument("--numprocs", type=int, default=10)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma separated, among {list(SCENARIOS)}")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="previous JSON results to compare with")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "programs": args.programs,
+        "numprocs": args.numprocs,
+        "metrics": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.scenarios.split(","):
+            metrics = SCENARIOS[name](workdir, args.programs, args.numprocs)
+            results["metrics"].update(metrics)
+            for key, value in metrics.items():
+                print(f"{key:<32}{value:>12.3f}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
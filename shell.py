@@ -1,18 +1,30 @@
 import signal
 from Supervisor import Supervisor
+from Federation import format_status
+from Jobs import JobManager
 from threading import Event
 import readline
 import sys
 
-COMMANDS = ["status", "start", "stop", "restart", "reread", "update", "shutdown", "help"]
+COMMANDS = ["status", "start", "stop", "restart", "signal", "stats", "reread", "update", "jobs", "wait", "cancel", "shutdown", "help"]
+PROMPT = "taskmaster > "
 
-sighup_event = Event()
+def shell_print(message: str):
+    """Print while input() waits, then give back the prompt and what was typed"""
+    print(f"\n{message}")
+    print(PROMPT + readline.get_line_buffer(), end="", flush=True)
 
-def completer(text, state):
-    options = [cmd for cmd in COMMANDS if cmd.startswith(text)]
-    if state < len(options):
-        return options[state]
-    return None
+def make_completer(taskmaster: Supervisor):
+    def completer(text, state):
+        if readline.get_line_buffer()[:readline.get_begidx()].strip():
+            # Arguments: process and group names from the cached index
+            options = [name for name in ["all"] + taskmaster.names() if name.startswith(text)]
+        else:
+            options = [cmd for cmd in COMMANDS if cmd.startswith(text)]
+        if state < len(options):
+            return options[state]
+        return None
+    return completer
 
 def print_no_args_command(command_name: str):
     print(f"""{command_name}: {command_name} requires a process name
@@ -21,33 +33,45 @@ def print_no_args_command(command_name: str):
     {command_name} all             Stop all processes
     """)
 
+def on_config_change(taskmaster: Supervisor):
+    shell_print("[!] config file changed → rereading config")
+    taskmaster.request_reread()
+
+def command_job(taskmaster: Supervisor, command: str, params: list):
+    all = "all" in params
+    names = None if all else params
+
+    def target(job):
+        if command in ("stop", "restart"):
+            taskmaster.stop(names, all, report=job.report, progress=job.progress("stopped"), cancel=job.cancel)
+        if command in ("start", "restart") and not job.cancel.is_set():
+            taskmaster.start(names, all, report=job.report, progress=job.progress("started"), cancel=job.cancel)
+    return target
+
 def run_shell(taskmaster: Supervisor, event: Event):
-    readline.set_completer(completer)
+    readline.set_completer(make_completer(taskmaster))
+    readline.set_completer_delims(" ")
     readline.parse_and_bind("tab: complete")
     readline.set_history_length(1000)
+    jobs = JobManager(notify=shell_print)
 
     def handle_sigquit(signum, frame):
         raise EOFError
 
     def handle_sighup(signum, frame):
-        print("\n[!] SIGHUP received → rereading config")
-        taskmaster.reread()
-        print("taskmaster > ", end="", flush=True)
+        # Only queued here: the reread runs on the supervise thread, between two ticks
+        shell_print("[!] SIGHUP received → rereading config")
+        taskmaster.request_reread()
 
     signal.signal(signal.SIGQUIT, handle_sigquit)
     signal.signal(signal.SIGHUP, handle_sighup)
 
     while not event.is_set():
         try:
-            user_input = input("taskmaster > ").strip()
+            user_input = input(PROMPT).strip()
             if not user_input:
                 continue
 
-            if sighup_event.is_set():
-                sighup_event.clear()
-                taskmaster.reread()
-                continue 
-
             args = user_input.split()
             command = args[0]
             params = args[1:]
@@ -56,6 +80,14 @@ def run_shell(taskmaster: Supervisor, event: Event):
             if command in commands_with_args and not params:
                 print_no_args_command(command)
                 continue
+            if command == "signal" and len(params) < 2:
+                print("""signal: signal requires a signal name and a process name
+    signal <SIG> <name>            Signal a process
+    signal <SIG> <gname>:*         Signal all processes in a group
+    signal <SIG> <name> <name>     Signal multiple processes or groups
+    signal <SIG> all               Signal all processes
+    """)
+                continue
 
             match command:
                 case "help":
@@ -64,6 +96,12 @@ def run_shell(taskmaster: Supervisor, event: Event):
   - start [<name1> <name2> ...] | all
   - stop [<name1> <name2> ...] | all
   - restart [<name1> <name2> ...] | all
+    (start, stop and restart run in the background)
+  - jobs
+  - wait [<job id> ...]
+  - cancel <job id> ...
+  - signal <SIG> [<name1> <gname>:* ...] | all
+  - stats [<name1> <gname>:* ...] | all
   - reread
   - update
   - shutdown
@@ -76,23 +114,42 @@ def run_shell(taskmaster: Supervisor, event: Event):
                     else:
                         taskmaster.status(processus_names=params)
 
-                case "start":
-                    if "all" in params:
-                        taskmaster.start(all=True)
-                    else:
-                        taskmaster.start(processus_names=params)
+                case "start" | "stop" | "restart":
+                    job = jobs.submit(user_input, command_job(taskmaster, command, params))
+                    print(f"[{job.id}] {user_input}")
 
-                case "stop":
-                    if "all" in params:
-                        taskmaster.stop(all=True)
+                case "jobs":
+                    for job in jobs.jobs.values():
+                        print(job.status())
+                    jobs.forget_finished()
+
+                case "wait":
+                    waited = [jobs.get(param) for param in params] if params else jobs.running()
+                    for job in waited:
+                        if job is None:
+                            print("wait: no such job")
+                            continue
+                        job.finished.wait()
+
+                case "cancel":
+                    for param in params:
+                        job = jobs.get(param)
+                        if job is None:
+                            print(f"cancel: {param}: no such job")
+                        else:
+                            job.cancel.set()
+
+                case "signal":
+                    if "all" in params[1:]:
+                        taskmaster.signal(params[0], all=True)
                     else:
-                        taskmaster.stop(processus_names=params)
+                        taskmaster.signal(params[0], processus_names=params[1:])
 
-                case "restart":
-                    if "all" in params:
-                        taskmaster.restart(all=True)
+                case "stats":
+                    if not params or "all" in params:
+                        taskmaster.stats(all=True)
                     else:
-                        taskmaster.restart(processus_names=params)
+                        taskmaster.stats(processus_names=params)
 
                 case "reread":
                     taskmaster.reread()
@@ -102,6 +159,8 @@ def run_shell(taskmaster: Supervisor, event: Event):
 
                 case "shutdown":
                     print("Shutting down...")
+                    for job in jobs.running():
+                        job.cancel.set()
                     taskmaster.shutdown()
                     event.set()
 
@@ -113,8 +172,92 @@ def run_shell(taskmaster: Supervisor, event: Event):
             continue
         except EOFError:
             print("\n[!] Caught Ctrl+D or SIGQUIT → shutting down...")
+            for job in jobs.running():
+                job.cancel.set()
             taskmaster.shutdown()
             event.set()
             break
         except Exception as e:
             print(f"Error: {e}")
+
+
+FLEET_COMMANDS = ["status", "start", "stop", "restart", "update", "hosts", "exit", "help"]
+
+def run_fleet_shell(federation):
+    """Aggregator mode: every command runs on all hosts in parallel"""
+    def fleet_completer(text, state):
+        options = [cmd for cmd in FLEET_COMMANDS if cmd.startswith(text)]
+        if state < len(options):
+            return options[state]
+        return None
+
+    readline.set_completer(fleet_completer)
+    readline.parse_and_bind("tab: complete")
+
+    while True:
+        try:
+            user_input = input("taskmaster fleet > ").strip()
+            if not user_input:
+                continue
+            args = user_input.split()
+            command = args[0]
+            params = args[1:]
+
+            if command in ["start", "stop", "restart"] and not params:
+                print_no_args_command(command)
+                continue
+
+            match command:
+                case "help":
+                    print("""Available commands (<name>@<host> targets a single host):
+  - status [<host> ...]
+  - start [<name1> <name2>@<host> ...] | all
+  - stop [<name1> <name2>@<host> ...] | all
+  - restart [<name1> <name2>@<host> ...] | all
+  - update [<host> ...]
+  - hosts
+  - exit
+                    """)
+
+                case "status":
+                    for host, processes in federation.status(params or None).items():
+                        if federation.hosts[host].error:
+                            print(f"{host:<16}ERROR ({federation.hosts[host].error})")
+                        for processus in processes:
+                            print(format_status(host, processus))
+
+                case "start" | "stop" | "restart":
+                    for host, response in federation.command(command, params).items():
+                        if not response.get("ok"):
+                            print(f"{host:<16}ERROR ({response.get('error')})")
+                            continue
+                        for key in ("stopped", "started", "pending", "errors"):
+                            for name in response.get(key, []):
+                                print(f"{host:<16}{name} : {key}")
+                        for message in response.get("messages", []):
+                            print(f"{host:<16}{message}")
+
+                case "update":
+                    for host, response in federation.update(params or None).items():
+                        for message in response.get("messages", []):
+                            print(f"{host:<16}{message}")
+                        print(f"{host:<16}{'updated' if response.get('ok') else 'ERROR (' + str(response.get('error')) + ')'}")
+
+                case "hosts":
+                    for host in federation.hosts.values():
+                        print(f"{host.name:<16}{host.address:<40}{'ERROR (' + host.error + ')' if host.error else ''}")
+
+                case "exit":
+                    break
+
+                case _:
+                    print(f"Unknown command: {command}")
+
+        except KeyboardInterrupt:
+            print("")
+            continue
+        except EOFError:
+            print("")
+            break
+        except Exception as e:
+            print(f"Error: {e}")
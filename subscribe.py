@@ -0,0 +1,24 @@
+import argparse
+from Events import subscribe
+
+def main(args):
+    try:
+        for event in subscribe(args.socket, args.program, args.state, args.since):
+            if "seq" in event and "to" in event:
+                print(f"{event['seq']:>8} {event['name']:<32}{event['from']:<14}-> {event['to']:<14}"
+                      f"{'' if event['exitcode'] is None else event['exitcode']}", flush=True)
+            else:
+                print(event, flush=True)
+    except OSError as e:
+        print(f"Can't subscribe : {e}")
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Taskmaster state transitions stream")
+    parser.add_argument("-s", "--socket", default="/tmp/taskmaster.events.sock", help="Event socket of taskmaster")
+    parser.add_argument("-p", "--program", action="append", help="Program, process or pattern (web, web:1, web:*)")
+    parser.add_argument("--state", action="append", help="Only transitions to this state (RUNNING, FATAL...)")
+    parser.add_argument("--since", type=int, help="Resume after this sequence number")
+    args = parser.parse_args()
+    main(args)
@@ -1,16 +1,35 @@
 import argparse
 from Supervisor import Supervisor
-from shell import run_shell
+from shell import run_shell, on_config_change
+from Watcher import ConfigWatcher
+from Events import EventServer
+from Control import ControlServer
+from Federation import Federation
+from LogMux import LogMultiplexer
+from Notify import NotifyServer
+from shell import run_fleet_shell
 from threading import Thread, Event
 import logging
 import sys
+import os
+
+def main_fleet(args):
+    try:
+        federation = Federation.from_file(args.federate, args.token, args.concurrency)
+    except (OSError, ValueError) as e:
+        print(f"Federation error : {e}")
+        sys.exit(1)
+    run_fleet_shell(federation)
+    federation.close()
 
 def main(args):
+    if args.federate:
+        return main_fleet(args)
     try:
         stop_event = Event()
 
-        taskmaster = Supervisor()
-        taskmaster.load_config(args)
+        taskmaster = Supervisor(use_config_cache=not args.no_cache)
+        taskmaster.load_config(args.config)
         try:
             logging.basicConfig(
                 filename="/tmp/taskmaster.log",
@@ -21,10 +40,42 @@ def main(args):
             print(f"Logging file error : {e}", file=sys.stderr)
             sys.exit(1) 
 
+        watcher = None
+        if args.watch:
+            try:
+                watcher = ConfigWatcher(taskmaster.config_set, lambda: on_config_change(taskmaster))
+                watcher.start()
+            except OSError as e:
+                print(f"Config watcher disabled : {e}", file=sys.stderr)
+
+        event_server = None
+        if args.events:
+            try:
+                event_server = EventServer(args.events)
+                event_server.start()
+            except OSError as e:
+                print(f"Event socket disabled : {e}", file=sys.stderr)
+
+        control_server = None
+        if args.listen:
+            try:
+                control_server = ControlServer(taskmaster, args.listen, args.token)
+                control_server.start()
+            except (OSError, ValueError) as e:
+                print(f"Control socket disabled : {e}", file=sys.stderr)
+
         monitoring = Thread(target=taskmaster.supervise, args=(stop_event,))
         monitoring.start()
         run_shell(taskmaster, stop_event)
         monitoring.join()
+        LogMultiplexer().stop()
+        NotifyServer().stop()
+        if watcher is not None:
+            watcher.stop()
+        if event_server is not None:
+            event_server.stop()
+        if control_server is not None:
+            control_server.stop()
     except OSError as e:
         print(f"Open failed : {e}")
     except KeyboardInterrupt:
@@ -36,6 +87,15 @@ def main(args):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Taskmaster")
-    parser.add_argument("-c", "--config", required=True, help="Path to config file.yml")
+    parser.add_argument("-c", "--config", help="Path to config file.yml")
+    parser.add_argument("--no-cache", action="store_true", help="Don't use the compiled config cache")
+    parser.add_argument("--events", metavar="SOCKET", help="Stream state transitions on this unix socket (see subscribe.py)")
+    parser.add_argument("--watch", action="store_true", help="Reread the config when one of its files changes (inotify)")
+    parser.add_argument("--listen", metavar="ADDRESS", help="Control socket for a fleet: unix:/path or tcp:host:port")
+    parser.add_argument("--federate", metavar="HOSTS", help="Fleet shell over the hosts of this file (hosts: name: address)")
+    parser.add_argument("--concurrency", type=int, default=64, help="Hosts contacted at the same time in fleet mode")
+    parser.add_argument("--token", default=os.environ.get("TASKMASTER_TOKEN"), help="Shared secret of the control sockets")
     args = parser.parse_args()
-    main(args.config)
+    if not args.config and not args.federate:
+        parser.error("one of -c/--config or --federate is required")
+    main(args)
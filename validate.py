@@ -1,6 +1,7 @@
 import os
 import signal
 import shlex
+from Placement import parse_cpulist, format_cpulist
 from enum import Enum, auto
 
 class Autorestart(Enum):
@@ -15,10 +16,16 @@ class Autorestart(Enum):
         except ValueError:
             raise ValueError(f"Invalid autorestart value: '{value}'. Must be one of {[e.value for e in cls]}")
 
-def validate_task_config(name, config):
-    validated_env = validate_env(name, config, {})
-    merged_env = {**os.environ, **validated_env}
+VALID_SIGNALS = frozenset(sig[3:] for sig in dir(signal) if sig.startswith("SIG") and not sig.startswith("SIG_"))
 
+# Filesystem checks are shared by every program using the same path, see reset_path_checks()
+_path_checks = {}
+
+def reset_path_checks():
+    _path_checks.clear()
+
+def validate_program(name, config):
+    """Validate a program once, 'env' only holds the overrides from the config"""
     return {
         "name": validate_name(name, config),
         "cmd": validate_cmd(name, config),
@@ -34,9 +41,37 @@ def validate_task_config(name, config):
         "stoptime": validate_positive_int(name, config, "stoptime", 10),
         "stdout": validate_output_file(name, config, "stdout"),
         "stderr": validate_output_file(name, config, "stderr"),
-        "env": merged_env,
+        "env": validate_env(name, config, {}),
+        "cgroup": validate_cgroup(name, config),
+        "reload_signal": validate_reload_signal(name, config),
+        "log_multiplex": validate_log_multiplex(name, config),
+        "notify": validate_notify(name, config),
+        "ready_timeout": validate_positive_int(name, config, "ready_timeout", 90),
+        "watchdog": validate_positive_int(name, config, "watchdog", 0),
+        "cpu_affinity": validate_cpu_affinity(name, config),
+        "numa": validate_numa(name, config),
+        **validate_scaling(name, config),
     }
 
+def revalidate_paths(name, program):
+    """Checks of the machine state only (files, allowed CPUs), for programs coming from the compiled config cache"""
+    error = check_workingdir(program["workingdir"])
+    if error:
+        err(name, error)
+    if isinstance(program["cpu_affinity"], list):
+        error = check_cpus(program["cpu_affinity"])
+        if error:
+            err(name, error)
+    for key in ("stdout", "stderr"):
+        if program[key] is not None and not is_syslog_target(program[key]):
+            error = check_output_file(program[key])
+            if error:
+                err(name, f"'{key}' {error}")
+
+def finalize_program(program):
+    """Merge the environment, the returned dict can be shared by every instance"""
+    return {**program, "env": {**os.environ, **program["env"]}}
+
 def err(name, msg):
     raise ValueError(f"Task '{name}': {msg}")
 
@@ -97,12 +132,22 @@ def validate_workingdir(name, config, default):
     workingdir = config.get("workingdir", default)
     if not isinstance(workingdir, str):
         err(name, "'workingdir' must be a string.")
-    if not os.path.isdir(workingdir):
-        err(name, f"'workingdir' path '{workingdir}' does not exist or is not a directory.")
-    if not os.access(workingdir, os.W_OK):
-        err(name, f"'workingdir' path '{workingdir}' is not writable.")
+    error = check_workingdir(workingdir)
+    if error:
+        err(name, error)
     return workingdir
 
+def check_workingdir(workingdir):
+    key = ("workingdir", workingdir)
+    if key not in _path_checks:
+        if not os.path.isdir(workingdir):
+            _path_checks[key] = f"'workingdir' path '{workingdir}' does not exist or is not a directory."
+        elif not os.access(workingdir, os.W_OK):
+            _path_checks[key] = f"'workingdir' path '{workingdir}' is not writable."
+        else:
+            _path_checks[key] = None
+    return _path_checks[key]
+
 def validate_autostart(name, config, default):
     autostart = config.get("autostart", default)
     if not isinstance(autostart, bool):
@@ -132,26 +177,199 @@ def validate_positive_int(name, config, key, default):
 
 def validate_stopsignal(name, config, default):
     stopsignal = config.get("stopsignal", default)
-    valid_signals = {sig[3:] for sig in dir(signal) if sig.startswith("SIG") and not sig.startswith("SIG_")}
-    if stopsignal not in valid_signals:
+    if stopsignal not in VALID_SIGNALS:
         err(name, f"'stopsignal' must be a valid signal name like TERM, INT, USR1 (got '{stopsignal}')")
     return stopsignal
 
+def validate_reload_signal(name, config):
+    reload_signal = config.get("reload_signal")
+    if reload_signal is not None and reload_signal not in VALID_SIGNALS:
+        err(name, f"'reload_signal' must be a valid signal name like HUP, USR1 (got '{reload_signal}')")
+    return reload_signal
+
+def parse_signal(value):
+    """'HUP', 'SIGHUP' or '1' to a signal number, None if invalid"""
+    value = str(value).upper()
+    if value.isdigit():
+        try:
+            return signal.Signals(int(value))
+        except ValueError:
+            return None
+    if value.startswith("SIG"):
+        value = value[3:]
+    if value not in VALID_SIGNALS:
+        return None
+    return getattr(signal, f"SIG{value}")
+
 def validate_output_file(name, config, key):
     path = config.get(key)
     if not path:
         return None
     if not isinstance(path, str):
         err(name, f"'{key}' must be a string.")
-    try:
-        with open(path, "a"):
-            pass
-    except Exception as e:
-        err(name, f"'{key}' path '{path}' is not writable or cannot be created: {e}")
+    if is_syslog_target(path):
+        return path
+    error = check_output_file(path)
+    if error:
+        err(name, f"'{key}' {error}")
     return path
 
+def is_syslog_target(path):
+    """'syslog' or 'syslog:/path/to/socket', only with log_multiplex"""
+    return path == "syslog" or path.startswith("syslog:")
+
+def validate_log_multiplex(name, config):
+    log_multiplex = config.get("log_multiplex", False)
+    if not isinstance(log_multiplex, bool):
+        err(name, "'log_multiplex' must be a boolean.")
+    for key in ("stdout", "stderr"):
+        path = config.get(key)
+        if isinstance(path, str) and is_syslog_target(path) and not log_multiplex:
+            err(name, f"'{key}: {path}' requires 'log_multiplex: true'.")
+    return log_multiplex
+
+def validate_notify(name, config):
+    notify = config.get("notify", False)
+    if not isinstance(notify, bool):
+        err(name, "'notify' must be a boolean.")
+    if config.get("watchdog") and not notify:
+        err(name, "'watchdog' requires 'notify: true' (the program sends WATCHDOG=1).")
+    return notify
+
+def validate_cpu_affinity(name, config):
+    """'spread', 'pack', a list of CPUs or a cpulist string like '0-3,8'"""
+    cpu_affinity = config.get("cpu_affinity")
+    if cpu_affinity is None or cpu_affinity in ("spread", "pack"):
+        return cpu_affinity
+    cpus = cpu_affinity
+    if isinstance(cpu_affinity, str):
+        try:
+            cpus = parse_cpulist(cpu_affinity)
+        except ValueError:
+            cpus = None
+    elif isinstance(cpu_affinity, int) and not isinstance(cpu_affinity, bool):
+        cpus = [cpu_affinity]
+    if (not isinstance(cpus, list) or not cpus
+            or not all(isinstance(cpu, int) and not isinstance(cpu, bool) and cpu >= 0 for cpu in cpus)):
+        err(name, "'cpu_affinity' must be spread, pack or a list of CPUs like [0, 1] or '0-3,8'.")
+    error = check_cpus(cpus)
+    if error:
+        err(name, error)
+    return cpus
+
+def check_cpus(cpus):
+    unknown = sorted(set(cpus) - os.sched_getaffinity(0))
+    if unknown:
+        return f"'cpu_affinity' CPUs {format_cpulist(unknown)} are not available (allowed: {format_cpulist(os.sched_getaffinity(0))})."
+    return None
+
+def validate_numa(name, config):
+    numa = config.get("numa")
+    if numa is not None and numa not in ("interleave", "local"):
+        err(name, f"'numa' must be interleave or local (got '{numa}').")
+    return numa
+
+def check_output_file(path):
+    key = ("output", path)
+    if key not in _path_checks:
+        try:
+            with open(path, "a"):
+                pass
+            _path_checks[key] = None
+        except Exception as e:
+            _path_checks[key] = f"path '{path}' is not writable or cannot be created: {e}"
+    return _path_checks[key]
+
+def validate_cgroup(name, config):
+    cgroup = config.get("cgroup")
+    if cgroup is None:
+        return None
+    if not isinstance(cgroup, str) or not os.path.isabs(cgroup):
+        err(name, "'cgroup' must be an absolute path to a cgroup v2 directory.")
+    return cgroup
+
 def validate_env(name, config, default):
     env = config.get("env", default)
     if not isinstance(env, dict) or not all(isinstance(k, str) and isinstance(v, str) for k, v in env.items()):
         err(name, "'env' must be a dictionary of string:string.")
     return env
+
+AUTOSCALE_METRICS = ("cpu", "queue", "latency")
+
+def validate_scaling(name, config):
+    """autoscale, min_procs and max_procs, checked with the rest so a broken edit is refused by refresh()"""
+    autoscale = validate_autoscale(name, config)
+    if autoscale is None:
+        return {"autoscale": None, "min_procs": None, "max_procs": None}
+    min_procs, max_procs = validate_procs_range(name, config, validate_numprocs(name, config))
+    return {"autoscale": autoscale, "min_procs": min_procs, "max_procs": max_procs}
+
+def validate_procs_range(name, config, numprocs):
+    min_procs = config.get("min_procs", numprocs)
+    max_procs = config.get("max_procs", numprocs)
+    for key, val in (("min_procs", min_procs), ("max_procs", max_procs)):
+        if not isinstance(val, int) or val < 1 or val > 10000:
+            err(name, f"'{key}' must be a positive integer between 1 and 10 000.")
+    if min_procs > max_procs:
+        err(name, f"'min_procs' ({min_procs}) must be lower or equal to 'max_procs' ({max_procs}).")
+    return min_procs, max_procs
+
+def validate_autoscale(name, config):
+    autoscale = config.get("autoscale")
+    if autoscale is None:
+        return None
+    if not isinstance(autoscale, dict):
+        err(name, "'autoscale' must be a dictionary.")
+
+    metric = autoscale.get("metric")
+    if metric not in AUTOSCALE_METRICS:
+        err(name, f"'autoscale.metric' must be one of {list(AUTOSCALE_METRICS)} (got '{metric}').")
+
+    sources = {
+        "cpu": (),
+        "queue": ("queue_file", "queue_cmd"),
+        "latency": ("healthcheck", "healthcheck_cmd"),
+    }[metric]
+    source = None
+    for key in sources:
+        if autoscale.get(key) is not None:
+            if source is not None:
+                err(name, f"'autoscale' accepts only one of {list(sources)}.")
+            source = key
+    if sources and source is None:
+        err(name, f"'autoscale' metric '{metric}' requires one of {list(sources)}.")
+
+    value = autoscale.get(source) if source else None
+    if source is not None and (not isinstance(value, str) or not value.strip()):
+        err(name, f"'autoscale.{source}' must be a non-empty string.")
+    if source in ("queue_cmd", "healthcheck_cmd"):
+        try:
+            value = shlex.split(value)
+        except ValueError as e:
+            err(name, f"'autoscale.{source}' invalid command syntax: {e}")
+    if source == "healthcheck":
+        host, _, port = value.rpartition(":")
+        if not host or not port.isdigit():
+            err(name, f"'autoscale.healthcheck' must be 'host:port' (got '{value}').")
+        value = (host, int(port))
+
+    thresholds = {}
+    for key in ("scale_up", "scale_down"):
+        val = autoscale.get(key)
+        if isinstance(val, bool) or not isinstance(val, (int, float)) or val < 0:
+            err(name, f"'autoscale.{key}' is required and must be a non-negative number.")
+        thresholds[key] = float(val)
+    if thresholds["scale_down"] >= thresholds["scale_up"]:
+        err(name, "'autoscale.scale_down' must be lower than 'autoscale.scale_up'.")
+
+    return {
+        "metric": metric,
+        "source": source,
+        "target": value,
+        "scale_up": thresholds["scale_up"],
+        "scale_down": thresholds["scale_down"],
+        "step": validate_positive_int(name, autoscale, "step", 1) or 1,
+        "interval": validate_positive_int(name, autoscale, "interval", 5) or 1,
+        "cooldown_up": validate_positive_int(name, autoscale, "cooldown_up", 30),
+        "cooldown_down": validate_positive_int(name, autoscale, "cooldown_down", 60),
+    }